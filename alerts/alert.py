@@ -1,13 +1,21 @@
 import dataclasses
+import functools
 import logging
+import time
 import traceback
 from abc import ABC, abstractmethod
+from typing import Optional
 
 from aiogram import Bot
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+from alerts.delivery import MessageDelivery
+from alerts.scan_context import ScanContext, DEFAULT_MAX_AGE
+from alerts.shards import ShardLeases
 from alerts.toncenter import Toncenter
-from database import Database, UserModel
+from database import Database, UserModel, NodeModel
+from database.subscriptions import SubscriptionIndex
+from metrics import ALERT_CHECK_SECONDS, ALERT_ERRORS
 
 
 @dataclasses.dataclass
@@ -40,48 +48,115 @@ ALERTS = {
 }
 
 
+@functools.cache
+def alert_keyboard(alert_type: str) -> InlineKeyboardMarkup:
+    buttons = [[InlineKeyboardButton(text=f"Disable {ALERTS[alert_type].name} Alerts", callback_data=f"alert:disable_no_edit:{alert_type}")]]
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
 class Alert(ABC):
 
     disable_notification = False
+    only_with_nodes = True
+    # scheduling of the alert's own loop, see AlertScheduler
+    interval: float = 30
+    jitter: float = 0
+    timeout: float = 120
+    # alerts with a fingerprint() skip the check while upstream data and subscriptions stay the same
+    skip_unchanged = False
 
-    def __init__(self, toncenter: Toncenter, database: Database, bot: Bot, *args, **kwargs):
+    def __init__(self, toncenter: Toncenter, database: Database, bot: Bot, context: Optional[ScanContext] = None,
+                 delivery: Optional[MessageDelivery] = None, shards: Optional[ShardLeases] = None,
+                 max_age: float = DEFAULT_MAX_AGE, *args, **kwargs):
         self.toncenter: Toncenter = toncenter
         self.database: Database = database
         self.bot: Bot = bot
+        self.context: Optional[ScanContext] = context
+        self.delivery: Optional[MessageDelivery] = delivery
+        self.shards: Optional[ShardLeases] = shards
+        # max age of the subscriptions and triggered alerts a run loads its context from
+        self.max_age: float = max_age
         self.alert_type: str = self.__class__.__name__
         self.logger = logging.getLogger(self.alert_type)
+        # (fingerprint, subscriptions, subscriptions version) of the last successful check
+        self.evaluated: Optional[tuple[str, SubscriptionIndex, int]] = None
+        self.only_users: Optional[set[int]] = None
 
     async def get_users(self):
-        return await self.database.get_users_with_enabled_alert(self.alert_type)
+        return self.context.get_users(self.alert_type, only_with_nodes=self.only_with_nodes)
+
+    async def get_user_nodes(self, user_id: int) -> list[NodeModel]:
+        return self.context.get_user_nodes(user_id)
+
+    def get_subscribers(self, adnl: str) -> list[tuple[UserModel, NodeModel]]:
+        subscribers = self.context.get_subscribers(adnl, self.alert_type)
+        if self.only_users is not None:
+            return [(user, node) for user, node in subscribers if user.user_id in self.only_users]
+        return subscribers
 
     async def run(self):
         self.logger.info(f'Alert {self.alert_type} running is started.')
+        own_context = self.context is None
         try:
+            if own_context:
+                self.context = await ScanContext.load(self.database, self.shards, self.max_age)
             users = await self.get_users()
-            if not users:
-                return
-            await self.check(users)
+            if users:
+                await self.evaluate(users)
         except Exception as e:
+            ALERT_ERRORS.inc(alert=self.alert_type)
             self.logger.warning(f"Error in alert: {e}\n{traceback.format_exc()}")
+        finally:
+            if own_context and self.context is not None:
+                await self.context.flush(self.database, self.bot, self.delivery)
+                self.context = None
         self.logger.info(f'Alert {self.alert_type} running is done.')
 
-    async def send_message(self, user_id: int, text: str) -> None:
+    async def evaluate(self, users: list[UserModel]) -> None:
+        subscriptions = self.context.subscriptions
+        fingerprint = await self.fingerprint() if self.skip_unchanged else None
+        if fingerprint is not None and self.evaluated is not None:
+            last_fingerprint, last_subscriptions, last_version = self.evaluated
+            if fingerprint == last_fingerprint and subscriptions is last_subscriptions:
+                # nothing changed upstream, only subscriptions added since the last check can get new alerts
+                self.only_users = subscriptions.get_added_users(last_version)
+                users = [user for user in users if user.user_id in self.only_users]
+        version = subscriptions.version
+        started = time.perf_counter()
         try:
-            buttons = [[InlineKeyboardButton(text=f"Disable {ALERTS[self.alert_type].name} Alerts", callback_data=f"alert:disable_no_edit:{self.alert_type}")]]
-            markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await self.bot.send_message(chat_id=user_id, text=text, disable_notification=self.disable_notification, reply_markup=markup)
-        except Exception as e:
-            self.logger.warning(f"Failed to send message to {user_id}: {e}")
-            return
+            if users:
+                await self.check(users)
+        finally:
+            self.only_users = None
+            ALERT_CHECK_SECONDS.observe(time.perf_counter() - started, alert=self.alert_type)
+        self.evaluated = (fingerprint, subscriptions, version) if fingerprint is not None else None
+
+    async def fingerprint(self) -> Optional[str]:
+        return None
+
+    async def send_message(self, user_id: int, text: str) -> None:
+        # delivered as a part of the user's digest when the scan is done
+        self.context.outbox.add(user_id, self.alert_type, text, self.disable_notification, alert_keyboard(self.alert_type))
+
+    def render(self, template: str, **params) -> str:
+        return self.context.render.text(template, **params)
 
     @abstractmethod
     async def check(self, users: list[UserModel]) -> None:
         pass
 
+    async def is_triggered(self, user_id: int, alert_name: str) -> bool:
+        return (user_id, alert_name) in self.context.triggered
+
+    async def set_triggered(self, user_id: int, alert_name: str, triggered: bool) -> None:
+        if triggered:
+            self.context.triggered.add(user_id, alert_name)
+        else:
+            self.context.triggered.remove(user_id, alert_name)
+
     async def inform(self, user: UserModel, alert_name: str, text: str):
-        triggered_alerts = await self.database.get_triggered_alerts(user.user_id, alert_name)
-        if triggered_alerts:
+        if await self.is_triggered(user.user_id, alert_name):
             return
         await self.send_message(user.user_id, text)
-        await self.database.add_triggered_alert(user.user_id, alert_name)
+        await self.set_triggered(user.user_id, alert_name, True)
         self.logger.info(f"Sent alert {alert_name} to user {user.user_id}")
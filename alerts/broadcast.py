@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from alerts.delivery import MessageDelivery
+from database import Database
+from database.models import BroadcastModel
+
+
+class BroadcastProgress:
+	def __init__(self, broadcast: BroadcastModel):
+		self.broadcast = broadcast
+		self.started_at = time.time()
+		self.started_with = broadcast.sent + broadcast.blocked + broadcast.failed
+
+	@property
+	def processed(self) -> int:
+		return self.broadcast.sent + self.broadcast.blocked + self.broadcast.failed
+
+	@property
+	def rate(self) -> float:
+		elapsed = time.time() - self.started_at
+		return (self.processed - self.started_with) / elapsed if elapsed > 0 else 0.0
+
+	@property
+	def eta(self) -> Optional[float]:
+		if self.rate <= 0:
+			return None
+		return max(0, self.broadcast.total - self.processed) / self.rate
+
+	def format(self) -> str:
+		b = self.broadcast
+		eta = f"{int(self.eta) // 60}:{int(self.eta) % 60:02d}" if self.eta is not None else "—"
+		return (
+			f"<b>📨 Notification #{b.id} is being sent</b>\n\n"
+			f"Progress: <code>{self.processed}/{b.total}</code>\n"
+			f"✅ <code>{b.sent}</code> 🚫 <code>{b.blocked}</code> ❌ <code>{b.failed}</code>\n"
+			f"⚡ <code>{self.rate:.1f}</code> msg/s, ETA <code>{eta}</code>"
+		)
+
+
+class BroadcastEngine:
+	def __init__(self, database: Database, delivery: MessageDelivery, concurrency: int = 30, page_size: int = 500,
+				 progress_interval: float = 5):
+		self.database = database
+		self.delivery = delivery
+		self.concurrency = concurrency
+		self.page_size = page_size
+		self.progress_interval = progress_interval
+		self.task: Optional[asyncio.Task] = None
+		self.stopping = False
+		self.progress: Optional[BroadcastProgress] = None
+		self.logger = logging.getLogger(self.__class__.__name__)
+
+	@property
+	def running(self) -> bool:
+		return self.task is not None and not self.task.done()
+
+	def start(self, broadcast: BroadcastModel, on_progress: Callable[[BroadcastProgress], Awaitable],
+			  on_done: Callable[[BroadcastProgress], Awaitable], delay: float = 0) -> None:
+		self.task = asyncio.create_task(self.run(broadcast, on_progress, on_done, delay))
+
+	async def cancel(self) -> None:
+		if not self.running:
+			return
+		self.task.cancel()
+		await asyncio.gather(self.task, return_exceptions=True)
+		self.task = None
+
+	async def shutdown(self) -> None:
+		# unlike cancel() the broadcast stays 'running' and is resumed after restart
+		self.stopping = True
+		await self.cancel()
+
+	async def run(self, broadcast: BroadcastModel, on_progress: Callable[[BroadcastProgress], Awaitable],
+				  on_done: Callable[[BroadcastProgress], Awaitable], delay: float = 0) -> None:
+		self.progress = progress = BroadcastProgress(broadcast)
+		try:
+			await asyncio.sleep(delay)
+			broadcast.total = progress.processed + await self.database.count_recipients(broadcast.last_user_id)
+			progress.started_at = time.time()
+			reporter = asyncio.create_task(self.report(progress, on_progress))
+			try:
+				await self.send_all(broadcast)
+			finally:
+				reporter.cancel()
+			broadcast.status = 'done'
+			await self.database.update_broadcast(broadcast)
+			await on_done(progress)
+		except asyncio.CancelledError:
+			if not self.stopping:
+				broadcast.status = 'cancelled'
+			await self.database.update_broadcast(broadcast)
+			raise
+		except Exception as e:
+			self.logger.exception(f"Broadcast {broadcast.id} failed: {e}")
+			broadcast.status = 'failed'
+			await self.database.update_broadcast(broadcast)
+
+	async def report(self, progress: BroadcastProgress, on_progress: Callable[[BroadcastProgress], Awaitable]) -> None:
+		while True:
+			await asyncio.sleep(self.progress_interval)
+			try:
+				await self.database.update_broadcast(progress.broadcast)
+				await on_progress(progress)
+			except Exception as e:
+				self.logger.warning(f"Failed to report broadcast progress: {e}")
+
+	async def send_all(self, broadcast: BroadcastModel) -> None:
+		recipients: asyncio.Queue[Optional[list]] = asyncio.Queue(maxsize=self.concurrency * 2)
+		# recipients in the order they were read, the cursor only moves over a completed prefix
+		in_flight: deque[list] = deque()
+
+		async def produce():
+			after = broadcast.last_user_id
+			while True:
+				user_ids = await self.database.get_recipients(after, self.page_size)
+				if not user_ids:
+					break
+				for user_id in user_ids:
+					item = [user_id, False]
+					in_flight.append(item)
+					await recipients.put(item)
+				after = user_ids[-1]
+			for _ in range(self.concurrency):
+				await recipients.put(None)
+
+		async def consume():
+			while True:
+				item = await recipients.get()
+				if item is None:
+					return
+				result = await self.delivery.deliver(item[0], broadcast.text)
+				if result == 'sent':
+					broadcast.sent += 1
+				elif result == 'blocked':
+					broadcast.blocked += 1
+				else:
+					broadcast.failed += 1
+				item[1] = True
+				while in_flight and in_flight[0][1]:
+					broadcast.last_user_id = in_flight.popleft()[0]
+
+		await asyncio.gather(produce(), *[consume() for _ in range(self.concurrency)])
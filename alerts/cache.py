@@ -0,0 +1,76 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from database import Database
+
+
+class ResponseCache:
+	def __init__(self, max_size: int = 256):
+		self.max_size = max_size
+		self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+		self._in_flight: dict[str, asyncio.Task] = {}
+
+	def get(self, key: str):
+		entry = self._entries.get(key)
+		if entry is None:
+			return None
+		expires_at, value = entry
+		if expires_at <= time.monotonic():
+			del self._entries[key]
+			return None
+		self._entries.move_to_end(key)
+		return value
+
+	def set(self, key: str, value: Any, ttl: float) -> None:
+		if ttl <= 0:
+			return
+		self._entries[key] = (time.monotonic() + ttl, value)
+		self._entries.move_to_end(key)
+		if len(self._entries) > self.max_size:
+			self.evict()
+
+	def evict(self) -> None:
+		now = time.monotonic()
+		for key in [k for k, (expires_at, _) in self._entries.items() if expires_at <= now]:
+			del self._entries[key]
+		while len(self._entries) > self.max_size:
+			self._entries.popitem(last=False)
+
+	def invalidate(self, key: str = None) -> None:
+		if key is None:
+			self._entries.clear()
+		else:
+			self._entries.pop(key, None)
+
+	async def get_or_fetch(self, key: str, ttl: float, fetch: Callable[[], Awaitable[Any]]):
+		value = self.get(key)
+		if value is not None:
+			return value
+		task = self._in_flight.get(key)
+		if task is None:
+			# the fetch runs as its own task so that a cancelled caller does not cancel it for the others
+			task = asyncio.ensure_future(fetch())
+			self._in_flight[key] = task
+			task.add_done_callback(lambda t: self._on_fetched(key, ttl, t))
+		return await asyncio.shield(task)
+
+	def _on_fetched(self, key: str, ttl: float, task: asyncio.Task) -> None:
+		if self._in_flight.get(key) is task:
+			del self._in_flight[key]
+		if task.cancelled() or task.exception() is not None:
+			return
+		self.set(key, task.result(), ttl)
+
+
+class SharedResponseCache:
+	# responses stored in the database so that scanner workers reuse each other's fetches
+	def __init__(self, database: Database):
+		self.database = database
+
+	async def get(self, key: str, max_age: float) -> Optional[Any]:
+		return await self.database.get_upstream_response(key, max_age)
+
+	async def set(self, key: str, value: Any) -> None:
+		await self.database.set_upstream_response(key, value)
@@ -1,7 +1,7 @@
 import time
 
 from alerts.alert import Alert
-from alerts.utils import amount_formatting
+from alerts.utils import amount_formatting, fingerprint
 from database import UserModel
 from handlers.utils import TEXTS
 
@@ -9,9 +9,18 @@ from handlers.utils import TEXTS
 class ComplaintsInformation(Alert):
 
 	disable_notification = True
+	only_with_nodes = False  # send this alert to all users
+	interval = 300
+	jitter = 30
+	timeout = 180
+	skip_unchanged = True
 
-	async def get_users(self):
-		return await self.database.get_users_with_enabled_alert(self.alert_type, only_with_nodes=False)  # send this alert to all users
+	async def fingerprint(self) -> str:
+		past_validation_cycle = await self.toncenter.get_validation_cycle(past=True)
+		election_id = past_validation_cycle['cycle_id']
+		if time.time() < past_validation_cycle['cycle_info']['utime_until'] + 1200:
+			return fingerprint(election_id, None)
+		return fingerprint(election_id, await self.toncenter.get_complaints_list(election_id))
 
 	async def check(self, users: list[UserModel]):
 		past_validation_cycle = await self.toncenter.get_validation_cycle(past=True)
@@ -29,12 +38,13 @@ class ComplaintsInformation(Alert):
 		complaints.reverse()
 
 		complaints_text = ''
+		cycle_data = await self.toncenter.get_cycle_data(election_id) if complaints else None
 		for complaint in complaints:
 			penalty = complaint['suggested_fine'] // 10**9
 			penalty_text = amount_formatting(penalty)
-			validator = await self.toncenter.get_validator(complaint['adnl_addr'], past=True)
-			efficiency = await self.toncenter.get_validator_efficiency(complaint['adnl_addr'], election_id)
-			complaints_text += TEXTS['complaint'].format(index=validator['index'], adnl=complaint['adnl_addr'],
+			validator = cycle_data.get_validator(complaint['adnl_addr'])
+			efficiency = cycle_data.get_efficiency(complaint['adnl_addr'])
+			complaints_text += self.render(TEXTS['complaint'], index=validator['index'], adnl=complaint['adnl_addr'],
 														 efficiency=efficiency, penalty=penalty_text)
 			complaints_text += '\n'
 		if not complaints:
@@ -43,7 +53,7 @@ class ComplaintsInformation(Alert):
 		start_time = timestamp2utcdatetime(election_id)
 		end_time = timestamp2utcdatetime(utime_until)
 		election_id_text = f'<a href="https://validators.ton.org/?cycle_id={election_id}">{election_id}</a>'
-		inform_text = TEXTS["complaints_information"].format(election_id=election_id_text, start_time=start_time, end_time=end_time, complaints=complaints_text)
+		inform_text = self.render(TEXTS["complaints_information"], election_id=election_id_text, start_time=start_time, end_time=end_time, complaints=complaints_text)
 
 		alert_name = f"{type(self).__name__}-{election_id}"
 
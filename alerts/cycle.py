@@ -0,0 +1,20 @@
+from typing import Optional
+
+
+class ValidationCycleData:
+	def __init__(self, cycle: dict, scoreboard: list[dict]):
+		self.cycle_id: int = cycle['cycle_id']
+		self.cycle = cycle
+		self.validators: dict[str, dict] = {}
+		for validator in cycle['cycle_info']['validators']:
+			if validator.get('adnl_addr'):
+				self.validators.setdefault(validator['adnl_addr'], validator)
+		self.efficiency: dict[str, float] = {}
+		for validator in scoreboard:
+			self.efficiency.setdefault(validator['adnl_addr'], round(validator['efficiency'], 2))
+
+	def get_validator(self, adnl: str) -> Optional[dict]:
+		return self.validators.get(adnl)
+
+	def get_efficiency(self, adnl: str) -> Optional[float]:
+		return self.efficiency.get(adnl)
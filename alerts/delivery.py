@@ -0,0 +1,203 @@
+import asyncio
+import dataclasses
+import logging
+import time
+from collections import deque
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (TelegramRetryAfter, TelegramForbiddenError, TelegramNetworkError,
+								TelegramServerError, TelegramBadRequest)
+from aiogram.types import InlineKeyboardMarkup
+
+from alerts.ratelimit import TokenBucket, backoff_delay
+from database import Database
+from metrics import QUEUE_DEPTH, TELEGRAM_SEND_SECONDS, TELEGRAM_SENDS
+
+
+@dataclasses.dataclass
+class OutgoingMessage:
+	chat_id: int
+	text: str
+	disable_notification: bool = False
+	reply_markup: Optional[InlineKeyboardMarkup] = None
+	attempts: int = 0
+
+
+class MessageDelivery:
+	# messages are queued per chat so that a chat waiting for its own limit does not hold back the others
+	def __init__(self, bot: Bot, database: Database, workers: int = 16, global_rate: float = 30,
+				 chat_rate: float = 1, chat_burst: float = 3, max_attempts: int = 5):
+		self.bot = bot
+		self.database = database
+		self.workers_count = workers
+		self.max_attempts = max_attempts
+		self.global_bucket = TokenBucket(global_rate)
+		self.chat_rate = chat_rate
+		self.chat_burst = chat_burst
+		self.chat_buckets: dict[int, TokenBucket] = {}
+		self.chat_queues: dict[int, deque[OutgoingMessage]] = {}
+		self.ready: asyncio.Queue[int] = asyncio.Queue()
+		self.scheduled: set[int] = set()
+		self.pending = 0
+		self.idle = asyncio.Event()
+		self.idle.set()
+		self.workers: list[asyncio.Task] = []
+		self.logger = logging.getLogger(self.__class__.__name__)
+
+	async def start(self) -> None:
+		if self.workers:
+			return
+		self.workers = [asyncio.create_task(self.worker()) for _ in range(self.workers_count)]
+		QUEUE_DEPTH.set_function(lambda: self.pending, queue='delivery_messages')
+		QUEUE_DEPTH.set_function(self.ready.qsize, queue='delivery_ready_chats')
+
+	async def stop(self, timeout: float = 30) -> None:
+		try:
+			await asyncio.wait_for(self.idle.wait(), timeout)
+		except asyncio.TimeoutError:
+			self.logger.warning(f"Dropping {self.pending} undelivered messages")
+		for worker in self.workers:
+			worker.cancel()
+		await asyncio.gather(*self.workers, return_exceptions=True)
+		self.workers = []
+
+	def enqueue(self, message: OutgoingMessage) -> None:
+		self.chat_queues.setdefault(message.chat_id, deque()).append(message)
+		self.pending += 1
+		self.idle.clear()
+		self.schedule(message.chat_id)
+
+	def schedule(self, chat_id: int, delay: float = 0) -> None:
+		if chat_id in self.scheduled:
+			return
+		self.scheduled.add(chat_id)
+		if delay > 0:
+			asyncio.get_running_loop().call_later(delay, self.ready.put_nowait, chat_id)
+		else:
+			self.ready.put_nowait(chat_id)
+
+	def get_chat_bucket(self, chat_id: int) -> TokenBucket:
+		bucket = self.chat_buckets.get(chat_id)
+		if bucket is None:
+			if len(self.chat_buckets) > 10000:
+				self.chat_buckets = {k: v for k, v in self.chat_buckets.items() if not v.idle}
+			bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, capacity=self.chat_burst)
+		return bucket
+
+	async def worker(self) -> None:
+		while True:
+			chat_id = await self.ready.get()
+			try:
+				delay = await self.process_chat(chat_id)
+			except asyncio.CancelledError:
+				self.scheduled.discard(chat_id)
+				raise
+			self.scheduled.discard(chat_id)
+			if delay is not None:
+				self.schedule(chat_id, delay)
+
+	async def process_chat(self, chat_id: int) -> Optional[float]:
+		# sends the next message of the chat, returns when the chat should be processed again
+		queue = self.chat_queues.get(chat_id)
+		if not queue:
+			self.chat_queues.pop(chat_id, None)
+			return None
+		wait = self.get_chat_bucket(chat_id).try_acquire()
+		if wait > 0:
+			return wait
+		message = queue.popleft()
+		try:
+			await self.global_bucket.acquire()
+			result = await self.send(message)
+		except asyncio.CancelledError:
+			queue.appendleft(message)
+			raise
+		except Exception as e:
+			self.logger.warning(f"Failed to send message to {chat_id}: {e}")
+			result = 'failed'
+		if result == 'retry':
+			queue.appendleft(message)
+			return backoff_delay(message.attempts)
+		self.done()
+		if result == 'blocked':
+			self.drop_chat(chat_id)
+			return None
+		if queue:
+			return 0
+		self.chat_queues.pop(chat_id, None)
+		return None
+
+	def done(self, count: int = 1) -> None:
+		self.pending -= count
+		if self.pending <= 0:
+			self.pending = 0
+			self.idle.set()
+
+	def drop_chat(self, chat_id: int) -> None:
+		queue = self.chat_queues.pop(chat_id, None)
+		if queue:
+			self.done(len(queue))
+
+	async def deliver(self, chat_id: int, text: str, disable_notification: bool = False,
+					  reply_markup: Optional[InlineKeyboardMarkup] = None) -> str:
+		# sends right away under the same limits as the queue and returns 'sent', 'blocked' or 'failed'
+		message = OutgoingMessage(chat_id, text, disable_notification, reply_markup)
+		bucket = self.get_chat_bucket(chat_id)
+		while True:
+			await bucket.acquire()
+			await self.global_bucket.acquire()
+			try:
+				result = await self.send(message)
+			except Exception as e:
+				self.logger.warning(f"Failed to send message to {chat_id}: {e}")
+				return 'failed'
+			if result != 'retry':
+				return result
+			await asyncio.sleep(backoff_delay(message.attempts))
+
+	async def send(self, message: OutgoingMessage) -> str:
+		started = time.perf_counter()
+		result = 'error'
+		try:
+			result = await self.try_send(message)
+			return result
+		finally:
+			TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - started)
+			TELEGRAM_SENDS.inc(result=result)
+
+	async def try_send(self, message: OutgoingMessage) -> str:
+		message.attempts += 1
+		try:
+			await self.bot.send_message(chat_id=message.chat_id, text=message.text,
+										disable_notification=message.disable_notification,
+										reply_markup=message.reply_markup)
+			return 'sent'
+		except TelegramRetryAfter as e:
+			# flood control applies to the whole bot, not only to this chat
+			self.global_bucket.pause(e.retry_after)
+			return 'retry'
+		except TelegramForbiddenError as e:
+			self.logger.info(f"User {message.chat_id} blocked the bot: {e}")
+			await self.database.set_user_blocked(message.chat_id, True)
+			return 'blocked'
+		except (TelegramNetworkError, TelegramServerError) as e:
+			if message.attempts < self.max_attempts:
+				return 'retry'
+			self.logger.warning(f"Failed to send message to {message.chat_id} after {message.attempts} attempts: {e}")
+			return 'failed'
+		except TelegramBadRequest as e:
+			self.logger.warning(f"Failed to send message to {message.chat_id}: {e}")
+			return 'failed'
+
+
+async def send_messages(messages: list[OutgoingMessage], bot: Bot, delivery: Optional[MessageDelivery] = None) -> None:
+	for message in messages:
+		if delivery is not None:
+			delivery.enqueue(message)
+			continue
+		try:
+			await bot.send_message(chat_id=message.chat_id, text=message.text,
+								   disable_notification=message.disable_notification, reply_markup=message.reply_markup)
+		except Exception as e:
+			logging.warning(f"Failed to send message to {message.chat_id}: {e}")
@@ -0,0 +1,50 @@
+from typing import Optional
+
+from aiogram.types import InlineKeyboardMarkup
+
+from alerts.delivery import OutgoingMessage
+
+MAX_MESSAGE_LENGTH = 4096
+
+
+class AlertOutbox:
+	# collects the alerts of a scan and sends each user one digest per alert type instead of a message per item
+	def __init__(self, max_length: int = MAX_MESSAGE_LENGTH, separator: str = '\n\n'):
+		self.max_length = max_length
+		self.separator = separator
+		self.groups: dict[tuple[int, str], list[str]] = {}
+		self.options: dict[tuple[int, str], tuple[bool, Optional[InlineKeyboardMarkup]]] = {}
+
+	def add(self, user_id: int, alert_type: str, text: str, disable_notification: bool = False,
+			reply_markup: Optional[InlineKeyboardMarkup] = None) -> None:
+		key = (user_id, alert_type)
+		if key not in self.groups:
+			self.groups[key] = []
+			self.options[key] = (disable_notification, reply_markup)
+		self.groups[key].append(text)
+
+	def __len__(self) -> int:
+		return sum(len(texts) for texts in self.groups.values())
+
+	def render(self) -> list[OutgoingMessage]:
+		messages = []
+		for (user_id, alert_type), texts in self.groups.items():
+			disable_notification, reply_markup = self.options[(user_id, alert_type)]
+			for text in self.join(texts):
+				messages.append(OutgoingMessage(user_id, text, disable_notification, reply_markup))
+		self.groups, self.options = {}, {}
+		return messages
+
+	def join(self, texts: list[str]) -> list[str]:
+		if len(texts) == 1:
+			return texts
+		chunks = []
+		current = ''
+		for text in texts:
+			if current and len(current) + len(self.separator) + len(text) > self.max_length:
+				chunks.append(current)
+				current = ''
+			current = current + self.separator + text if current else text
+		if current:
+			chunks.append(current)
+		return chunks
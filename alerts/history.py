@@ -0,0 +1,139 @@
+import json
+import os
+from typing import Optional
+
+import numpy as np
+
+from alerts.telemetry import METRICS, NodeTelemetry, TelemetryColumns
+
+NO_RUN = 2 ** 62
+
+
+class TelemetryHistory:
+	# the last `size` reports of every ADNL in fixed size arrays, memory-mapped .npy files in `path` survive restarts
+	def __init__(self, size: int = 64, path: Optional[str] = None, capacity: int = 1024):
+		self.size = size
+		self.path = path
+		self.rows: dict[str, int] = {}
+		if path is None or not self.load():
+			self.values, self.timestamps, self.heads = self.allocate(capacity)
+
+	def allocate(self, capacity: int, suffix: str = '') -> tuple:
+		return (
+			self.create(f'values{suffix}', (capacity, self.size, len(METRICS)), np.float32, np.nan),
+			self.create(f'timestamps{suffix}', (capacity, self.size), np.int64, 0),
+			self.create(f'heads{suffix}', (capacity,), np.int32, 0),
+		)
+
+	def create(self, name: str, shape: tuple, dtype, fill) -> "np.ndarray":
+		if self.path is None:
+			return np.full(shape, fill, dtype=dtype)
+		os.makedirs(self.path, exist_ok=True)
+		array = np.lib.format.open_memmap(os.path.join(self.path, f'{name}.npy'), mode='w+', dtype=dtype, shape=shape)
+		array[...] = fill
+		return array
+
+	def load(self) -> bool:
+		try:
+			with open(os.path.join(self.path, 'adnls.json')) as f:
+				adnls = json.load(f)
+			values, timestamps, heads = (np.lib.format.open_memmap(os.path.join(self.path, f'{name}.npy'), mode='r+')
+										 for name in ('values', 'timestamps', 'heads'))
+		except (OSError, ValueError):
+			return False
+		if values.shape[1:] != (self.size, len(METRICS)) or len(adnls) > len(heads):
+			return False
+		self.values, self.timestamps, self.heads = values, timestamps, heads
+		self.rows = {adnl: row for row, adnl in enumerate(adnls)}
+		return True
+
+	def save_rows(self) -> None:
+		if self.path is None:
+			return
+		path = os.path.join(self.path, 'adnls.json')
+		with open(path + '.new', 'w') as f:
+			json.dump(sorted(self.rows, key=self.rows.get), f)
+		os.replace(path + '.new', path)
+
+	def grow(self) -> None:
+		old = (self.values, self.timestamps, self.heads)
+		new = self.allocate(len(self.heads) * 2, suffix='.new' if self.path else '')
+		for old_array, new_array in zip(old, new):
+			new_array[:len(old_array)] = old_array
+		if self.path is not None:
+			for name, array in zip(('values', 'timestamps', 'heads'), new):
+				array.flush()
+				os.replace(os.path.join(self.path, f'{name}.new.npy'), os.path.join(self.path, f'{name}.npy'))
+		self.values, self.timestamps, self.heads = new
+
+	def get_row(self, adnl: str) -> int:
+		row = self.rows.get(adnl)
+		if row is None:
+			row = self.rows[adnl] = len(self.rows)
+			if row >= len(self.heads):
+				self.grow()
+		return row
+
+	def get_rows(self, adnls: list[str]) -> "np.ndarray":
+		return np.array([self.rows.get(adnl, -1) for adnl in adnls], dtype=np.int64)
+
+	def record(self, entries: list[NodeTelemetry]) -> None:
+		newest: dict[str, NodeTelemetry] = {}
+		for entry in entries:
+			if entry.timestamp is not None and entry.timestamp > getattr(newest.get(entry.adnl_address), 'timestamp', -1):
+				newest[entry.adnl_address] = entry
+		if not newest:
+			return
+		entries = list(newest.values())
+		known = len(self.rows)
+		rows = np.array([self.get_row(e.adnl_address) for e in entries], dtype=np.int64)
+		if len(self.rows) != known:
+			self.save_rows()
+		timestamps = np.array([e.timestamp for e in entries], dtype=np.int64)
+		heads = self.heads[rows]
+		# reports repeated by overlapping polls are already stored
+		fresh = timestamps > self.timestamps[rows, (heads - 1) % self.size]
+		rows, heads = rows[fresh], heads[fresh]
+		columns = TelemetryColumns(entries)
+		values = np.stack([columns.values[metric] for metric in METRICS], axis=1)[fresh]
+		self.values[rows, heads] = values
+		self.timestamps[rows, heads] = timestamps[fresh]
+		self.heads[rows] = (heads + 1) % self.size
+
+	def get(self, adnl: str, metric: str) -> list[tuple[int, float]]:
+		row = self.rows.get(adnl)
+		if row is None:
+			return []
+		order = (np.arange(self.size) + self.heads[row]) % self.size
+		timestamps, values = self.timestamps[row, order], self.values[row, order, METRICS.index(metric)]
+		return [(int(t), float(v)) for t, v in zip(timestamps, values) if t > 0]
+
+	def duration_over(self, rows: "np.ndarray", metric: str, above: Optional[float] = None,
+					  below: Optional[float] = None) -> "np.ndarray":
+		# seconds from the first report of the current run over the threshold to the latest report, -1 without a run
+		timestamps = self.timestamps[rows]
+		values = self.values[rows, :, METRICS.index(metric)]
+		valid = timestamps > 0
+		hit = valid & ((values > above) if above is not None else (values < below))
+		last_miss = np.where(valid & ~hit, timestamps, 0).max(axis=1)
+		run_start = np.where(hit & (timestamps > last_miss[:, None]), timestamps, NO_RUN).min(axis=1)
+		latest = timestamps.max(axis=1)
+		return np.where(run_start != NO_RUN, latest - run_start, -1)
+
+	def filter_sustained(self, rows: "np.ndarray", indices: list[int], metric: str, seconds: float,
+						 above: Optional[float] = None, below: Optional[float] = None) -> list[int]:
+		# keeps the indices of nodes over the threshold for at least `seconds`, nodes without history are kept
+		if not indices:
+			return indices
+		selected = rows[indices]
+		known = selected >= 0
+		durations = np.full(len(indices), -1, dtype=np.int64)
+		durations[known] = self.duration_over(selected[known], metric, above, below)
+		keep = ~known | (durations >= seconds)
+		return [index for index, kept in zip(indices, keep) if kept]
+
+	def flush(self) -> None:
+		if self.path is not None:
+			for array in (self.values, self.timestamps, self.heads):
+				array.flush()
+			self.save_rows()
@@ -0,0 +1,161 @@
+import asyncio
+import cProfile
+import dataclasses
+import html
+import logging
+import marshal
+import os
+import pickle
+import time
+import tracemalloc
+from typing import Awaitable, Callable, Optional
+
+# the scheduler only checks `session`, nothing is profiled or traced until a session is armed
+session: Optional["ProfileSession"] = None
+# schedulers running in this process, a session armed without one would never see an alert run
+schedulers = 0
+
+TRACEMALLOC_FRAMES = 5
+
+
+@dataclasses.dataclass
+class ProfileReport:
+	text: str
+	files: dict[str, bytes]
+
+
+def short_function(key: tuple) -> str:
+	filename, line, name = key
+	if filename == '~':
+		return name
+	return f"{os.path.basename(filename)}:{line}({name})"
+
+
+class ProfileSession:
+	# profiles the next `runs` alert runs, or everything for `seconds` when it is set
+	def __init__(self, on_done: Callable[[ProfileReport], Awaitable[None]], runs: int = 1,
+				 seconds: Optional[float] = None, cpu: bool = True, memory: bool = False, top: int = 15):
+		self.on_done = on_done
+		self.remaining = runs if seconds is None else 0
+		self.seconds = seconds
+		self.cpu = cpu
+		self.memory = memory
+		self.top = top
+		self.pending = 0
+		self.runs: list[tuple[str, float]] = []
+		self.started_at: Optional[float] = None
+		self.profile: Optional[cProfile.Profile] = None
+		self.started_tracing = False
+		self.timer: Optional[asyncio.TimerHandle] = None
+		self.task: Optional[asyncio.Task] = None
+		self.finished = False
+		self.logger = logging.getLogger(self.__class__.__name__)
+
+	def start(self) -> None:
+		self.started_at = time.monotonic()
+		if self.memory:
+			self.started_tracing = not tracemalloc.is_tracing()
+			if self.started_tracing:
+				tracemalloc.start(TRACEMALLOC_FRAMES)
+			tracemalloc.reset_peak()
+		if self.cpu:
+			self.profile = cProfile.Profile()
+			self.profile.enable()
+
+	def run_started(self) -> bool:
+		if self.seconds is not None:
+			return self.started_at is not None
+		if self.remaining <= 0:
+			return False
+		self.remaining -= 1
+		self.pending += 1
+		if self.started_at is None:
+			self.start()
+		return True
+
+	def run_finished(self, alert_type: str, duration: float) -> None:
+		self.runs.append((alert_type, duration))
+		if self.seconds is None:
+			self.pending -= 1
+			if self.remaining <= 0 and self.pending <= 0:
+				self.finish()
+
+	def finish(self) -> None:
+		global session
+		if session is self:
+			session = None
+		if self.timer is not None:
+			self.timer.cancel()
+		if self.finished or self.started_at is None:
+			return
+		self.finished = True
+		if self.profile is not None:
+			self.profile.disable()
+		snapshot, peak = None, 0
+		if self.memory:
+			snapshot = tracemalloc.take_snapshot()
+			peak = tracemalloc.get_traced_memory()[1]
+			if self.started_tracing:
+				tracemalloc.stop()
+		report = self.report(time.monotonic() - self.started_at, snapshot, peak)
+		self.task = asyncio.create_task(self.deliver(report))
+
+	async def deliver(self, report: ProfileReport) -> None:
+		try:
+			await self.on_done(report)
+		except Exception as e:
+			self.logger.error(f"Failed to deliver profile report: {e}")
+
+	def report(self, elapsed: float, snapshot: Optional[tracemalloc.Snapshot], peak: int) -> ProfileReport:
+		lines = [f"<b>🔬 Profile of {len(self.runs)} alert runs in {elapsed:.1f} sec</b>"]
+		durations: dict[str, list[float]] = {}
+		for alert_type, duration in self.runs:
+			durations.setdefault(alert_type, []).append(duration)
+		lines += [
+			f"{alert_type}: {len(values)} runs, max <code>{max(values):.3f}</code> sec"
+			for alert_type, values in durations.items()
+		]
+		files = {}
+		if self.profile is not None:
+			self.profile.create_stats()
+			rows = sorted(self.profile.stats.items(), key=lambda item: item[1][2], reverse=True)[:self.top]
+			table = [f"{'own':>8} {'total':>8} {'calls':>8} function"]
+			table += [f"{tt:8.3f} {ct:8.3f} {nc:8} {short_function(key)[:60]}" for key, (cc, nc, tt, ct, callers) in rows]
+			lines.append(f"\n<b>CPU, top {self.top} by own time:</b>")
+			lines.append(f"<pre>{html.escape(chr(10).join(table))}</pre>")
+			# same format as Profile.dump_stats, readable with pstats or snakeviz
+			files['scan.prof'] = marshal.dumps(self.profile.stats)
+		if snapshot is not None:
+			snapshot = snapshot.filter_traces([
+				tracemalloc.Filter(False, tracemalloc.__file__),
+				tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+			])
+			statistics = snapshot.statistics('lineno')[:self.top]
+			table = [f"{'KiB':>10} {'blocks':>8} line"]
+			table += [
+				f"{stat.size / 1024:10.1f} {stat.count:8} {os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}"
+				for stat in statistics
+			]
+			lines.append(f"\n<b>Memory, top {self.top} live allocations, peak {peak / 2 ** 20:.1f} MiB:</b>")
+			lines.append(f"<pre>{html.escape(chr(10).join(table))}</pre>")
+			# same format as Snapshot.dump, readable with tracemalloc.Snapshot.load
+			files['scan.tracemalloc'] = pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL)
+		return ProfileReport('\n'.join(lines), files)
+
+
+def arm(new_session: ProfileSession) -> None:
+	global session
+	if session is not None:
+		raise RuntimeError("Profiling is already armed")
+	session = new_session
+	if new_session.seconds is not None:
+		new_session.start()
+		new_session.timer = asyncio.get_running_loop().call_later(new_session.seconds, new_session.finish)
+
+
+def stop() -> Optional[ProfileSession]:
+	# finishes the armed session early, reporting whatever was collected
+	stopped = session
+	if stopped is not None:
+		stopped.finish()
+	return stopped
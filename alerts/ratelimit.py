@@ -0,0 +1,119 @@
+import asyncio
+import email.utils
+import random
+import time
+from typing import Optional
+
+
+class CircuitOpenError(Exception):
+	pass
+
+
+class TokenBucket:
+	def __init__(self, rate: float, capacity: Optional[float] = None, min_rate: Optional[float] = None):
+		self.max_rate = rate
+		self.rate = rate
+		self.min_rate = min_rate if min_rate is not None else rate / 10
+		self.capacity = capacity if capacity is not None else max(1.0, rate)
+		self.tokens = self.capacity
+		self.updated = time.monotonic()
+		self.paused_until = 0.0
+		self._lock = asyncio.Lock()
+
+	def _refill(self) -> None:
+		now = time.monotonic()
+		self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+		self.updated = now
+
+	async def acquire(self, tokens: float = 1) -> None:
+		async with self._lock:
+			while True:
+				now = time.monotonic()
+				if now < self.paused_until:
+					await asyncio.sleep(self.paused_until - now)
+					continue
+				self._refill()
+				if self.tokens >= tokens:
+					self.tokens -= tokens
+					return
+				await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+	def try_acquire(self, tokens: float = 1) -> float:
+		# takes the tokens if available and returns 0, otherwise returns how long to wait for them
+		now = time.monotonic()
+		if now < self.paused_until:
+			return self.paused_until - now
+		self._refill()
+		if self.tokens >= tokens:
+			self.tokens -= tokens
+			return 0.0
+		return (tokens - self.tokens) / self.rate
+
+	@property
+	def idle(self) -> bool:
+		self._refill()
+		return self.tokens >= self.capacity and time.monotonic() >= self.paused_until
+
+	def pause(self, seconds: float) -> None:
+		self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+	def slow_down(self, factor: float = 0.5) -> None:
+		self._refill()
+		self.rate = max(self.min_rate, self.rate * factor)
+
+	def speed_up(self, step: Optional[float] = None) -> None:
+		if self.rate >= self.max_rate:
+			return
+		self._refill()
+		self.rate = min(self.max_rate, self.rate + (step if step is not None else self.max_rate / 20))
+
+
+class CircuitBreaker:
+	def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+		self.failure_threshold = failure_threshold
+		self.reset_timeout = reset_timeout
+		self.failures = 0
+		self.opened_at: Optional[float] = None
+
+	@property
+	def state(self) -> str:
+		if self.opened_at is None:
+			return 'closed'
+		if time.monotonic() - self.opened_at >= self.reset_timeout:
+			return 'half-open'
+		return 'open'
+
+	def allow(self) -> bool:
+		state = self.state
+		if state == 'half-open':
+			# let a single probe through, the next one waits for another reset_timeout
+			self.opened_at = time.monotonic()
+			return True
+		return state == 'closed'
+
+	def record_success(self) -> None:
+		self.failures = 0
+		self.opened_at = None
+
+	def record_failure(self) -> None:
+		self.failures += 1
+		if self.opened_at is not None or self.failures >= self.failure_threshold:
+			self.opened_at = time.monotonic()
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 10) -> float:
+	return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+	if not value:
+		return None
+	try:
+		return max(0.0, float(value))
+	except ValueError:
+		pass
+	try:
+		retry_at = email.utils.parsedate_to_datetime(value)
+	except (TypeError, ValueError):
+		return None
+	return max(0.0, retry_at.timestamp() - time.time())
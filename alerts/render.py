@@ -0,0 +1,20 @@
+from collections import OrderedDict
+
+
+class RenderCache:
+	# formatted texts of one scan, fan-out alerts format a text once for all of its recipients
+	def __init__(self, max_size: int = 4096):
+		self.max_size = max_size
+		self.texts: OrderedDict[tuple, str] = OrderedDict()
+
+	def text(self, template: str, **params) -> str:
+		key = (template, tuple(sorted(params.items())))
+		text = self.texts.get(key)
+		if text is not None:
+			self.texts.move_to_end(key)
+			return text
+		text = template.format(**params)
+		self.texts[key] = text
+		if len(self.texts) > self.max_size:
+			self.texts.popitem(last=False)
+		return text
@@ -0,0 +1,61 @@
+from typing import Optional
+
+from aiogram import Bot
+
+from alerts.delivery import MessageDelivery, send_messages
+from alerts.digest import AlertOutbox
+from alerts.render import RenderCache
+from alerts.shards import ShardLeases
+from database import Database, UserModel, NodeModel
+from database.subscriptions import SubscriptionIndex
+from database.triggered import TriggeredAlerts
+
+
+# subscriptions are re-read from the database now and then in case memory missed a change made elsewhere
+DEFAULT_MAX_AGE = 3600
+
+
+class ScanContext:
+	def __init__(self, subscriptions: SubscriptionIndex, triggered: TriggeredAlerts, shards: Optional[ShardLeases] = None):
+		self.subscriptions = subscriptions
+		self.shards = shards
+		self.triggered = triggered
+		self.outbox = AlertOutbox()
+		self.render = RenderCache()
+
+	@classmethod
+	async def load(cls, database: Database, shards: Optional[ShardLeases] = None,
+				   max_age: float = DEFAULT_MAX_AGE) -> "ScanContext":
+		subscriptions = await database.get_subscriptions(max_age=max_age)
+		triggered = await database.get_triggered()
+		return cls(subscriptions, triggered, shards)
+
+	async def flush(self, database: Database, bot: Bot, delivery: Optional[MessageDelivery] = None) -> None:
+		messages = self.outbox.render()
+		if self.shards is not None:
+			# a shard may have been taken over by another worker while the alerts ran, its users are alerted there
+			messages = [message for message in messages if self.shards.owns(message.chat_id)]
+			if self.triggered.pending:
+				self.triggered.discard_pending(self.shards.owns)
+		try:
+			await send_messages(messages, bot, delivery)
+		finally:
+			await self.triggered.flush(database)
+
+	def get_users(self, alert_type: str, only_with_nodes: bool = True) -> list[UserModel]:
+		users = self.subscriptions.get_users(alert_type, only_with_nodes)
+		if self.shards is not None:
+			return [user for user in users if self.shards.owns(user.user_id)]
+		return users
+
+	def get_user_nodes(self, user_id: int) -> list[NodeModel]:
+		return self.subscriptions.get_user_nodes(user_id)
+
+	def get_adnls(self) -> list[str]:
+		return self.subscriptions.get_adnls()
+
+	def get_subscribers(self, adnl: str, alert_type: str) -> list[tuple[UserModel, NodeModel]]:
+		subscribers = self.subscriptions.get_subscribers(adnl, alert_type)
+		if self.shards is not None:
+			return [(user, node) for user, node in subscribers if self.shards.owns(user.user_id)]
+		return subscribers
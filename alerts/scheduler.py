@@ -0,0 +1,54 @@
+import asyncio
+import logging
+import random
+import time
+
+from alerts import profiler
+from alerts.alert import Alert
+from metrics import ALERT_LAG_SECONDS, ALERT_TIMEOUTS, ALERT_RUNS, ALERT_SKIPPED, ALERT_LAST_STARTED, ALERT_LAST_DURATION
+
+
+class AlertScheduler:
+	# every alert runs on its own loop, a slow alert never delays the others and never overlaps with itself
+	def __init__(self, alerts: list[Alert]):
+		self.alerts = alerts
+		self.logger = logging.getLogger(self.__class__.__name__)
+
+	async def run(self) -> None:
+		profiler.schedulers += 1
+		try:
+			await asyncio.gather(*[self.loop(alert) for alert in self.alerts])
+		finally:
+			profiler.schedulers -= 1
+
+	async def loop(self, alert: Alert) -> None:
+		next_run = time.monotonic()
+		while True:
+			planned = next_run + random.uniform(0, alert.jitter)
+			await asyncio.sleep(max(0.0, planned - time.monotonic()))
+			started = time.monotonic()
+			ALERT_RUNS.inc(alert=alert.alert_type)
+			ALERT_LAST_STARTED.set(time.time(), alert=alert.alert_type)
+			ALERT_LAG_SECONDS.observe(started - planned, alert=alert.alert_type)
+			profile = profiler.session
+			if profile is not None and not profile.run_started():
+				profile = None
+			try:
+				await asyncio.wait_for(alert.run(), alert.timeout)
+			except asyncio.TimeoutError:
+				ALERT_TIMEOUTS.inc(alert=alert.alert_type)
+				self.logger.warning(f"Alert {alert.alert_type} timed out after {alert.timeout}s")
+			except Exception as e:
+				self.logger.error(f"Error in alert {alert.alert_type}: {e}")
+			finished = time.monotonic()
+			duration = finished - started
+			ALERT_LAST_DURATION.set(duration, alert=alert.alert_type)
+			if profile is not None:
+				profile.run_finished(alert.alert_type, duration)
+			# ticks missed while the run was in progress are skipped rather than run back to back
+			next_run += alert.interval
+			if next_run < finished:
+				missed = int((finished - next_run) // alert.interval) + 1
+				ALERT_SKIPPED.inc(missed, alert=alert.alert_type)
+				next_run += missed * alert.interval
+				self.logger.warning(f"Alert {alert.alert_type} took {duration:.1f}s, skipped {missed} runs")
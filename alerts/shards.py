@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import time
+
+from database import Database
+
+
+class ShardLeases:
+	# users are split into shards by user id, each scanner worker alerts only the users of the shards it leases
+	def __init__(self, database: Database, worker_id: str, shards: int = 16, lease_ttl: int = 60,
+				 release_grace: int = 180):
+		self.database = database
+		self.worker_id = worker_id
+		self.shards = shards
+		self.lease_ttl = lease_ttl
+		# a released shard is claimable only after the runs of its previous owner had time to finish
+		self.release_grace = release_grace
+		self.owned: set[int] = set()
+		self.valid_until = 0.0
+		self.logger = logging.getLogger(self.__class__.__name__)
+
+	def shard_of(self, user_id: int) -> int:
+		return user_id % self.shards
+
+	def owns(self, user_id: int) -> bool:
+		return self.shard_of(user_id) in self.owned and time.time() < self.valid_until
+
+	async def start(self) -> None:
+		await self.database.init_shard_leases(self.shards)
+		await self.refresh()
+
+	async def run(self) -> None:
+		while True:
+			await asyncio.sleep(self.lease_ttl / 4)
+			try:
+				await self.refresh()
+			except Exception as e:
+				self.logger.error(f"Failed to refresh shard leases: {e}")
+
+	async def stop(self) -> None:
+		owned, self.owned = self.owned, set()
+		if owned:
+			await self.database.release_shard_leases(self.worker_id, owned, int(time.time()))
+		await self.database.remove_scanner_worker(self.worker_id)
+
+	def get_target(self, workers: list[str]) -> int:
+		index = workers.index(self.worker_id) if self.worker_id in workers else len(workers) - 1
+		return self.shards // len(workers) + (1 if index < self.shards % len(workers) else 0)
+
+	async def refresh(self) -> None:
+		workers = await self.database.heartbeat_scanner_worker(self.worker_id, self.lease_ttl)
+		target = self.get_target(workers or [self.worker_id])
+		expires_at = int(time.time()) + self.lease_ttl
+		owned = await self.database.renew_shard_leases(self.worker_id, expires_at)
+		if len(owned) > target:
+			extra = set(sorted(owned)[target:])
+			await self.database.release_shard_leases(self.worker_id, extra, int(time.time()) + self.release_grace)
+			owned -= extra
+		elif len(owned) < target:
+			owned |= await self.database.claim_shard_leases(self.worker_id, target - len(owned), expires_at)
+		self.valid_until = expires_at - self.lease_ttl / 4
+		if owned != self.owned:
+			self.logger.info(f"Worker {self.worker_id} of {len(workers)} owns shards {sorted(owned)}")
+			self.owned = owned
+			# a fresh subscription index makes the alerts check the users of new shards in full,
+			# triggered alerts of those users may have been changed by their previous owner
+			self.database.subscriptions = None
+			if self.database.triggered is not None:
+				self.database.triggered.expired = True
@@ -0,0 +1,154 @@
+import dataclasses
+import functools
+import os
+import time
+from typing import Iterable, Optional
+
+import aiohttp
+import numpy as np
+
+from alerts.utils import iter_json_array
+
+
+METRICS = ('Sync', 'CPU', 'RAM', 'Network', 'Disk')
+
+
+@dataclasses.dataclass(slots=True)
+class NodeTelemetry:
+	adnl_address: str
+	timestamp: Optional[int] = None
+	out_of_sync: Optional[int] = None
+	cpu_load: Optional[float] = None
+	cpu_number: Optional[int] = None
+	memory_usage: Optional[float] = None
+	memory_total: Optional[float] = None
+	net_load: Optional[float] = None
+	disk_load: Optional[float] = None
+	disk_load_percent: Optional[float] = None
+
+
+def project_telemetry(entry: dict) -> NodeTelemetry:
+	# keeps only the fields read by TelemetryAlert, a missing field leaves its metric unset
+	node = NodeTelemetry(adnl_address=entry['adnl_address'], timestamp=entry.get('timestamp'))
+	data = entry.get('data') or {}
+	try:
+		node.out_of_sync = data['validatorStatus']['out_of_sync']
+	except (KeyError, TypeError):
+		pass
+	try:
+		node.cpu_load, node.cpu_number = data['cpuLoad'][2], data['cpuNumber']
+	except (KeyError, IndexError, TypeError):
+		pass
+	try:
+		node.memory_usage, node.memory_total = data['memory']['usage'], data['memory']['total']
+	except (KeyError, TypeError):
+		pass
+	try:
+		node.net_load = data['netLoad'][2]
+	except (KeyError, IndexError, TypeError):
+		pass
+	try:
+		disk_name = os.path.basename(data['validatorDiskName'])
+		if disk_name not in data['disksLoad']:
+			disk_name = list(data['disksLoad'].keys())[0]
+		node.disk_load, node.disk_load_percent = data['disksLoad'][disk_name][2], data['disksLoadPercent'][disk_name][2]
+	except (KeyError, IndexError, TypeError):
+		pass
+	return node
+
+
+async def read_telemetry(response: aiohttp.ClientResponse, chunk_size: int = 64 * 1024) -> list[NodeTelemetry]:
+	entries = []
+	async for entry in iter_json_array(response.content.iter_chunked(chunk_size)):
+		entries.append(project_telemetry(entry))
+	return entries
+
+
+class TelemetrySnapshot:
+	def __init__(self, entries: Iterable[NodeTelemetry], fetched_at: Optional[float] = None):
+		self.fetched_at: float = fetched_at if fetched_at is not None else time.time()
+		self.nodes: dict[str, NodeTelemetry] = {}
+		for entry in entries:
+			current = self.nodes.get(entry.adnl_address)
+			if current is None or is_newer(entry, current):
+				self.nodes[entry.adnl_address] = entry
+
+	@property
+	def age(self) -> float:
+		return time.time() - self.fetched_at
+
+	def get(self, adnl: str) -> Optional[NodeTelemetry]:
+		return self.nodes.get(adnl)
+
+	def __contains__(self, adnl: str) -> bool:
+		return adnl in self.nodes
+
+	def __len__(self) -> int:
+		return len(self.nodes)
+
+	@functools.cached_property
+	def columns(self) -> "TelemetryColumns":
+		return TelemetryColumns(list(self.nodes.values()))
+
+
+class TelemetryColumns:
+	# one row per node and one column per metric, so that a threshold is compared for all nodes at once
+	def __init__(self, nodes: list[NodeTelemetry]):
+		self.nodes = nodes
+		self.values = self.get_arrays(nodes)
+
+	@staticmethod
+	def get_arrays(nodes: list[NodeTelemetry]) -> dict:
+		# a missing metric becomes NaN, which is neither above nor below any threshold
+		def column(values: list) -> "np.ndarray":
+			return np.array(values, dtype=np.float64)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			cpu = np.round(column([n.cpu_load for n in nodes]) / column([n.cpu_number for n in nodes]) * 100, 2)
+			ram = np.round(column([n.memory_usage for n in nodes]) / column([n.memory_total for n in nodes]) * 100, 2)
+		return {
+			'Sync': column([n.out_of_sync for n in nodes]),
+			'CPU': np.where(np.isfinite(cpu), cpu, np.nan),
+			'RAM': np.where(np.isfinite(ram), ram, np.nan),
+			'Network': column([n.net_load for n in nodes]),
+			'Disk': column([n.disk_load_percent for n in nodes]),
+		}
+
+	def crossed(self, metric: str, upper: float, lower: float) -> tuple[list[int], list[int]]:
+		# rows above upper and rows below lower
+		values = self.values[metric]
+		return np.flatnonzero(values > upper).tolist(), np.flatnonzero(values < lower).tolist()
+
+
+class TelemetryTable:
+	# latest report per ADNL, kept up to date by polling only the reports newer than the watermark
+	def __init__(self, window: int = 100, overlap: int = 10):
+		self.window = window
+		self.overlap = overlap
+		self.nodes: dict[str, NodeTelemetry] = {}
+		self.watermark: Optional[float] = None
+
+	def next_poll(self, now: float) -> tuple[int, bool]:
+		if self.watermark is None or now - self.watermark > self.window - self.overlap:
+			return int(now) - self.window, True
+		return int(self.watermark) - self.overlap, False
+
+	def merge(self, entries: list[NodeTelemetry], polled_at: float, full: bool) -> TelemetrySnapshot:
+		if full:
+			self.nodes = {}
+		for entry in entries:
+			if entry.timestamp is None:
+				entry.timestamp = int(polled_at)
+			current = self.nodes.get(entry.adnl_address)
+			if current is None or is_newer(entry, current):
+				self.nodes[entry.adnl_address] = entry
+		expired_before = polled_at - self.window
+		for adnl in [a for a, n in self.nodes.items() if n.timestamp < expired_before]:
+			del self.nodes[adnl]
+		self.watermark = polled_at
+		return TelemetrySnapshot(self.nodes.values(), fetched_at=polled_at)
+
+
+def is_newer(entry: NodeTelemetry, current: NodeTelemetry) -> bool:
+	if entry.timestamp is None or current.timestamp is None:
+		return False
+	return entry.timestamp > current.timestamp
@@ -1,97 +1,127 @@
-import asyncio
-import os
 from typing import Optional
 
 from alerts.alert import Alert
+from alerts.telemetry import NodeTelemetry
 from alerts.utils import get_adnl_text
 from database import UserModel, NodeModel
+from database.subscriptions import SubscriptionIndex
+from database.triggered import TriggeredAlerts
 from handlers.utils import TEXTS
 
 
 class TelemetryAlert(Alert):
 
-	@staticmethod
-	def get_node_telemetry(telemetry_list: list[dict], adnl: str) -> Optional[dict]:
-		for node in telemetry_list:
-			if node['adnl_address'] == adnl:
-				return node
-
-	async def check(self, users: list[UserModel]):
-		nodes_telemetry = await self.toncenter.get_telemetry_list()
-		for user in users:
-			nodes = await self.database.get_user_nodes(user.user_id)
-			for node in nodes:
-				node_telemetry = self.get_node_telemetry(nodes_telemetry, node.adnl)
-				if node_telemetry is None:
-					self.logger.info(f'Node {node.adnl} is not in telemetry list')
-					continue
-				tasks = [
-					self.check_sync(user, node_telemetry, node),
-					self.check_cpu(user, node_telemetry, node),
-					self.check_ram(user, node_telemetry, node),
-					self.check_network(user, node_telemetry, node),
-					self.check_disk(user, node_telemetry, node),
-				]
-				res = await asyncio.gather(*tasks, return_exceptions=True)
-				for r in res:
-					if isinstance(r, Exception):
-						self.logger.error(r)
-
-	async def check_sync(self, user: UserModel, node_data: dict, node: NodeModel):
-		out_of_sync = node_data['data']['validatorStatus']['out_of_sync']
-		await self.check_with_threshold(user, alert_name="Sync", node=node, value=out_of_sync,
-										upper=40, lower=20)
+	interval = 30
+	jitter = 3
+	# longer than Toncenter.retry_budget, a telemetry fetch that is being retried is not cut off
+	timeout = 90
 
-	async def check_cpu(self, user: UserModel, node_data: dict, node: NodeModel):
-		cpu_load = node_data['data']['cpuLoad'][2]
-		cpu_number = node_data['data']['cpuNumber']
-		value_percent = round(cpu_load / cpu_number * 100, 2)
-		await self.check_with_threshold(user, alert_name="CPU", node=node, value=value_percent,
-								  upper=90, lower=85, value_cpu_load=cpu_load,
-								  value_percent=value_percent, cpu_load_max=cpu_number)
+	# metric -> (upper, lower), an alert is raised above the upper threshold and cleared below the lower one
+	THRESHOLDS = {
+		'Sync': (40, 20),
+		'CPU': (90, 85),
+		'RAM': (90, 85),
+		'Network': (500, 450),
+		'Disk': (90, 80),
+	}
+	# seconds a metric has to stay over a threshold before the alert is raised or cleared, so that a single noisy
+	# report does not flip it, 0 reacts to the latest report
+	SUSTAIN = {
+		'Sync': 0,
+		'CPU': 120,
+		'RAM': 0,
+		'Network': 120,
+		'Disk': 120,
+	}
 
-	async def check_ram(self, user: UserModel, node_data: dict, node: NodeModel):
-		memory_usage = node_data['data']['memory']['usage']
-		memory_total = node_data['data']['memory']['total']
-		value_percent = round(memory_usage / memory_total * 100, 2)
-		await self.check_with_threshold(user, alert_name="RAM", node=node, value=value_percent,
-								  upper=90, lower=85, value_ram=memory_usage, ram_max=memory_total)
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		# report timestamp per ADNL and (subscriptions, version, triggered generation) of the last check, a node is checked
+		# again only when it sends a new report or gets a new subscriber
+		self.evaluated_reports: dict[str, Optional[int]] = {}
+		self.evaluated_state: Optional[tuple[SubscriptionIndex, int, TriggeredAlerts, int]] = None
 
-	async def check_network(self, user: UserModel, node_data: dict, node: NodeModel):
-		network_load = node_data['data']['netLoad'][2]
-		await self.check_with_threshold(user, alert_name="Network", node=node, value=network_load,
-								  upper=500, lower=450)
+	def get_changed(self, nodes: list[NodeTelemetry]) -> Optional[list[bool]]:
+		subscriptions, triggered = self.context.subscriptions, self.context.triggered
+		if self.evaluated_state is None:
+			return None
+		last_subscriptions, last_version, last_triggered, last_generation = self.evaluated_state
+		if subscriptions is not last_subscriptions or triggered is not last_triggered or triggered.generation != last_generation:
+			return None
+		added = {node.adnl for user_id in subscriptions.get_added_users(last_version)
+				 for node in self.context.get_user_nodes(user_id)}
+		reports = self.evaluated_reports
+		return [reports.get(n.adnl_address, -1) != n.timestamp or n.adnl_address in added for n in nodes]
 
-	async def check_disk(self, user: UserModel, node_data: dict, node: NodeModel):
-		disk_name = os.path.basename(node_data['data']['validatorDiskName'])
-		if disk_name not in node_data['data']['disksLoad']:
-			disk_name = list(node_data['data']['disksLoad'].keys())[0]
-		disk_load = node_data['data']['disksLoad'][disk_name][2]
-		disk_load_percent = node_data['data']['disksLoadPercent'][disk_name][2]
-		await self.check_with_threshold(user, alert_name="Disk", node=node, value=disk_load_percent,
-								  upper=90, lower=80, value_load=disk_load)
+	async def check(self, users: list[UserModel]):
+		state = (self.context.subscriptions, self.context.subscriptions.version, self.context.triggered, self.context.triggered.generation)
+		nodes_telemetry = await self.toncenter.get_telemetry_snapshot()
+		for adnl in self.context.get_adnls():
+			if adnl not in nodes_telemetry:
+				self.logger.info(f'Node {adnl} is not in telemetry list')
+		columns = nodes_telemetry.columns
+		history = self.toncenter.telemetry_history
+		rows = history.get_rows([n.adnl_address for n in columns.nodes])
+		changed = self.get_changed(columns.nodes)
+		crossed = []
+		for alert_name, (upper, lower) in self.THRESHOLDS.items():
+			over, under = columns.crossed(alert_name, upper, lower)
+			if changed is not None:
+				over, under = [i for i in over if changed[i]], [i for i in under if changed[i]]
+			sustain = self.SUSTAIN.get(alert_name, 0)
+			if sustain:
+				over = history.filter_sustained(rows, over, alert_name, sustain, above=upper)
+				under = history.filter_sustained(rows, under, alert_name, sustain, below=lower)
+			crossed += [(index, alert_name, True, upper) for index in over]
+			crossed += [(index, alert_name, False, lower) for index in under]
+		# alerts of a node stay together and in the order of THRESHOLDS
+		crossed.sort(key=lambda c: c[0])
+		triggered = self.context.triggered
+		# nodes with a failed warning are checked again on the next run, not on their next report
+		failed = set()
+		for index, alert_name, overloaded, threshold in crossed:
+			node_telemetry = columns.nodes[index]
+			# most nodes are fine most of the time, nothing to clear unless some subscriber has the alert raised
+			if not overloaded and not triggered.count(f"{type(self).__name__}-{alert_name}-{node_telemetry.adnl_address}"):
+				continue
+			for user, node in self.get_subscribers(node_telemetry.adnl_address):
+				try:
+					await self.warn(user, alert_name, overloaded, node, node_telemetry, threshold)
+				except Exception as e:
+					failed.add(node_telemetry.adnl_address)
+					self.logger.exception(f"Failed to warn user {user.user_id} about {alert_name}: {e}")
+		self.evaluated_reports = {n.adnl_address: n.timestamp for n in columns.nodes if n.adnl_address not in failed}
+		self.evaluated_state = state
 
-	async def check_with_threshold(self, user: UserModel, alert_name: str, node: NodeModel, upper: int, lower: int, value: int, **kwargs):
-		if value > upper:
-			await self.warn(user, alert_name, node=node, overloaded=True, threshold=upper, value=value, **kwargs)
-		elif value < lower:
-			await self.warn(user, alert_name, node=node, overloaded=False, threshold=lower, value=value, **kwargs)
+	@staticmethod
+	def get_params(alert_name: str, node_data: NodeTelemetry) -> dict:
+		if alert_name == 'CPU':
+			value_percent = round(node_data.cpu_load / node_data.cpu_number * 100, 2)
+			return dict(value=value_percent, value_cpu_load=node_data.cpu_load, value_percent=value_percent,
+						cpu_load_max=node_data.cpu_number)
+		if alert_name == 'RAM':
+			value_percent = round(node_data.memory_usage / node_data.memory_total * 100, 2)
+			return dict(value=value_percent, value_ram=node_data.memory_usage, ram_max=node_data.memory_total)
+		if alert_name == 'Network':
+			return dict(value=node_data.net_load)
+		if alert_name == 'Disk':
+			return dict(value=node_data.disk_load_percent, value_load=node_data.disk_load)
+		return dict(value=node_data.out_of_sync)
 
-	async def warn(self, user: UserModel, alert_type: str, overloaded: bool, node: NodeModel, **kwargs):
+	async def warn(self, user: UserModel, alert_type: str, overloaded: bool, node: NodeModel, node_data: NodeTelemetry, threshold: int):
 		alert_name = f"{type(self).__name__}-{alert_type}-{node.adnl}"
+		if await self.is_triggered(user.user_id, alert_name) == overloaded:
+			return
 		adnl_short = get_adnl_text(node.adnl, node.label)
 		overloaded_str = "_overloaded" if overloaded else "_ok"
 		text_name = alert_type.lower() + overloaded_str
-		text = TEXTS[text_name].format(adnl_short=adnl_short, adnl=node.adnl, **kwargs)
+		text = self.render(TEXTS[text_name], adnl_short=adnl_short, adnl=node.adnl, threshold=threshold,
+						   **self.get_params(alert_type, node_data))
 		await self.inform(user, alert_name, text, overloaded)
 
 	async def inform(self, user: UserModel, alert_name: str, text: str, overloaded: bool):
-		triggered_alerts = await self.database.get_triggered_alerts(user.user_id, alert_name)
-		if bool(triggered_alerts) == overloaded:
+		if await self.is_triggered(user.user_id, alert_name) == overloaded:
 			return
 		await self.send_message(user.user_id, text)
-		if overloaded:
-			await self.database.add_triggered_alert(user.user_id, alert_name)
-		else:
-			await self.database.delete_triggered_alert(user.user_id, alert_name)
+		await self.set_triggered(user.user_id, alert_name, overloaded)
 		self.logger.info(f"Sent alert {alert_name} to user {user.user_id}")
@@ -1,30 +1,170 @@
 import asyncio
 import time
-from typing import Optional
+from typing import Awaitable, Callable, Optional
 
 import aiohttp
+from yarl import URL
 
+from alerts.cache import ResponseCache, SharedResponseCache
+from alerts.cycle import ValidationCycleData
+from alerts.ratelimit import TokenBucket, CircuitBreaker, CircuitOpenError, backoff_delay, parse_retry_after
+from alerts.history import TelemetryHistory
+from alerts.telemetry import TelemetrySnapshot, TelemetryTable, read_telemetry
+from metrics import TONCENTER_REQUEST_SECONDS, TONCENTER_RESPONSES, TONCENTER_RESPONSE_BYTES
 
-async def try_get_url(url, timeout=30):
-	attempts = 3
-	async with aiohttp.ClientSession() as session:
-		for attempt in range(attempts):
+
+class Toncenter:
+	# seconds to keep a response of each endpoint, 0 only coalesces concurrent requests
+	CACHE_TTL = {
+		'getTelemetryData': 10,
+		'getValidationCycles': 60,
+		'getElections': 60,
+		'getComplaints': 60,
+		'cycleScoreboard': 300,
+	}
+
+	def __init__(self, api_key: str, timeout: float = 30, connect_timeout: float = 10, attempts: int = 3,
+				 limit: int = 100, limit_per_host: int = 20, dns_cache_ttl: int = 300, keepalive_timeout: float = 60,
+				 cache_size: int = 256, cache_ttl: Optional[dict[str, float]] = None,
+				 requests_per_second: float = 10, rate_limits: Optional[dict[str, float]] = None, retry_budget: float = 45,
+				 failure_threshold: int = 5, reset_timeout: float = 30, base_url: Optional[str] = None,
+				 shared_cache: Optional[SharedResponseCache] = None, history_size: int = 64,
+				 history_path: Optional[str] = None):
+		self.api_key = api_key
+		if base_url:
+			# all endpoints are served by a single host, e.g. the local fake_toncenter.py
+			base_url = base_url.rstrip('/')
+			self.telemetry_url = self.elections_url = self.toncenter_url = base_url
+		else:
+			self.telemetry_url = 'https://telemetry.toncenter.com'
+			self.elections_url = 'https://elections.toncenter.com'
+			self.toncenter_url = 'https://toncenter.com'
+		self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+		self.attempts = attempts
+		self.retry_budget = retry_budget
+		# the quota belongs to the API key, all hosts share it unless rate_limits gives a host its own
+		self.rate_limits = rate_limits or {}
+		self.limiter = TokenBucket(requests_per_second)
+		self.failure_threshold = failure_threshold
+		self.reset_timeout = reset_timeout
+		self.limiters: dict[str, TokenBucket] = {}
+		self.breakers: dict[str, CircuitBreaker] = {}
+		self.limit = limit
+		self.limit_per_host = limit_per_host
+		self.dns_cache_ttl = dns_cache_ttl
+		self.keepalive_timeout = keepalive_timeout
+		self._session: Optional[aiohttp.ClientSession] = None
+		self.cache = ResponseCache(max_size=cache_size)
+		self.cache_ttl = {**self.CACHE_TTL, **(cache_ttl or {})}
+		self.shared_cache = shared_cache
+		self.telemetry_snapshot: Optional[TelemetrySnapshot] = None
+		self.telemetry_table = TelemetryTable()
+		self.telemetry_history = TelemetryHistory(history_size, history_path)
+
+	async def start(self):
+		if self._session is not None and not self._session.closed:
+			return
+		connector = aiohttp.TCPConnector(
+			limit=self.limit,
+			limit_per_host=self.limit_per_host,
+			ttl_dns_cache=self.dns_cache_ttl,
+			keepalive_timeout=self.keepalive_timeout,
+		)
+		self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+	async def close(self):
+		self.telemetry_history.flush()
+		if self._session is not None and not self._session.closed:
+			await self._session.close()
+		self._session = None
+
+	async def get_session(self) -> aiohttp.ClientSession:
+		if self._session is None or self._session.closed:
+			await self.start()
+		return self._session
+
+	def get_limiter(self, host: str) -> TokenBucket:
+		if host not in self.rate_limits:
+			return self.limiter
+		if host not in self.limiters:
+			self.limiters[host] = TokenBucket(self.rate_limits[host])
+		return self.limiters[host]
+
+	def get_breaker(self, host: str) -> CircuitBreaker:
+		if host not in self.breakers:
+			self.breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+		return self.breakers[host]
+
+	async def try_get_url(self, url, read: Optional[Callable[[aiohttp.ClientResponse], Awaitable]] = None):
+		session = await self.get_session()
+		parsed_url = URL(url)
+		host, endpoint = parsed_url.host, parsed_url.path.rsplit('/', 1)[-1]
+		limiter = self.get_limiter(host)
+		breaker = self.get_breaker(host)
+		deadline = time.monotonic() + self.retry_budget
+		error = None
+		for attempt in range(self.attempts):
+			if not breaker.allow():
+				raise CircuitOpenError(f"{host} is unavailable after {breaker.failures} failed requests")
+			await limiter.acquire()
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				break
+			retry_after = None
+			started = time.perf_counter()
+			status = 'error'
 			try:
+				timeout = aiohttp.ClientTimeout(total=min(self.timeout.total, remaining), connect=self.timeout.connect)
 				async with session.get(url, timeout=timeout) as response:
+					status = response.status
 					if response.status == 200:
-						return await response.json()
-					response.raise_for_status()
-			except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-				if attempt < attempts - 1:
-					await asyncio.sleep(1)
-				else:
+						data = await read(response) if read is not None else await response.json()
+						TONCENTER_RESPONSE_BYTES.inc(response.content.total_bytes, endpoint=endpoint)
+						breaker.record_success()
+						limiter.speed_up()
+						return data
+					raise aiohttp.ClientResponseError(response.request_info, response.history, status=response.status,
+													  message=response.reason, headers=response.headers)
+			except aiohttp.ClientResponseError as e:
+				if e.status == 429:
+					limiter.slow_down()
+				elif 400 <= e.status < 500:
 					raise
-	raise Exception(f"Failed to fetch URL after {attempts} attempts: {url}: {e}")
+				else:
+					breaker.record_failure()
+				retry_after = parse_retry_after(e.headers.get('Retry-After') if e.headers else None)
+				error = e
+			except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+				breaker.record_failure()
+				error = e
+			finally:
+				TONCENTER_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+				TONCENTER_RESPONSES.inc(endpoint=endpoint, status=status)
+			if attempt == self.attempts - 1:
+				break
+			delay = retry_after if retry_after is not None else backoff_delay(attempt)
+			if retry_after is not None:
+				limiter.pause(retry_after)
+			if time.monotonic() + delay >= deadline:
+				break
+			await asyncio.sleep(delay)
+		if error is not None:
+			raise error
+		raise asyncio.TimeoutError(f"Retry budget of {self.retry_budget}s exceeded for {host}")
 
+	async def cached_get(self, endpoint: str, url: str, params: str = '', read: Optional[Callable] = None):
+		key = f"{endpoint}?{params}"
+		ttl = self.cache_ttl.get(endpoint, 0)
+		if self.shared_cache is not None and read is None and ttl > 0:
+			return await self.cache.get_or_fetch(key, ttl, lambda: self.shared_get(key, ttl, url))
+		return await self.cache.get_or_fetch(key, ttl, lambda: self.try_get_url(url, read))
 
-class Toncenter:
-	def __init__(self, api_key: str):
-		self.api_key = api_key
+	async def shared_get(self, key: str, ttl: float, url: str):
+		data = await self.shared_cache.get(key, ttl)
+		if data is None:
+			data = await self.try_get_url(url)
+			await self.shared_cache.set(key, data)
+		return data
 
 	async def get_validator_efficiency(self, adnl, election_id):
 		efficiency_list = await self.get_efficiency_list(election_id=election_id)
@@ -49,6 +189,9 @@ class Toncenter:
 		return result
 
 	async def is_send_telemetry(self, adnl: str) -> bool:
+		snapshot = self.telemetry_snapshot
+		if snapshot is not None and snapshot.age < 60 and adnl in snapshot:
+			return True
 		node = await self.get_telemetry_for_adnl(adnl)
 		if node:
 			return True
@@ -65,40 +208,61 @@ class Toncenter:
 		data = await self.get_validation_cycle(past=past)
 		return data['cycle_info']['validators']
 
+	async def get_cycle_data(self, cycle_id: int) -> ValidationCycleData:
+		async def fetch():
+			cycles, scoreboard = await asyncio.gather(
+				self.get_validation_cycles_list(),
+				self.get_efficiency_list(election_id=cycle_id),
+			)
+			for cycle in cycles:
+				if cycle['cycle_id'] == cycle_id:
+					return ValidationCycleData(cycle, scoreboard)
+			raise Exception(f"Validation cycle {cycle_id} not found")
+
+		key = f"cycleData?cycle_id={cycle_id}"
+		return await self.cache.get_or_fetch(key, self.cache_ttl.get('cycleScoreboard', 0), fetch)
+
 	async def get_election_data(self):
 		data = await self.get_elections_list()
 		return data[0]
 
 	async def get_telemetry_for_adnl(self, adnl: str) -> Optional[dict]:
 		timestamp = int(time.time())
-		url = f"https://telemetry.toncenter.com/getTelemetryData?timestamp_from={timestamp-100}&api_key={self.api_key}&adnl_address={adnl}"
-		data = await try_get_url(url)
+		url = f"{self.telemetry_url}/getTelemetryData?timestamp_from={timestamp-100}&api_key={self.api_key}&adnl_address={adnl}"
+		data = await self.cached_get('getTelemetryData', url, f'adnl_address={adnl}')
 		if data:
 			return data[0]
 		return None
 
-	async def get_telemetry_list(self) -> list:
-		timestamp = int(time.time())
-		url = f"https://telemetry.toncenter.com/getTelemetryData?timestamp_from={timestamp-100}&api_key={self.api_key}"
-		data = await try_get_url(url)
-		return data
+	async def get_telemetry_snapshot(self) -> TelemetrySnapshot:
+		async def fetch():
+			polled_at = time.time()
+			timestamp_from, full = self.telemetry_table.next_poll(polled_at)
+			url = f"{self.telemetry_url}/getTelemetryData?timestamp_from={timestamp_from}&api_key={self.api_key}"
+			entries = await self.try_get_url(url, read=read_telemetry)
+			self.telemetry_history.record(entries)
+			return self.telemetry_table.merge(entries, polled_at, full)
+
+		snapshot = await self.cache.get_or_fetch('getTelemetryData?', self.cache_ttl.get('getTelemetryData', 0), fetch)
+		self.telemetry_snapshot = snapshot
+		return snapshot
 
 	async def get_validation_cycles_list(self) -> list:
-		url = f"https://elections.toncenter.com/getValidationCycles?limit=2&api_key={self.api_key}"
-		data = await try_get_url(url)
+		url = f"{self.elections_url}/getValidationCycles?limit=2&api_key={self.api_key}"
+		data = await self.cached_get('getValidationCycles', url, 'limit=2')
 		return data
 
 	async def get_elections_list(self) -> list:
-		url = f"https://elections.toncenter.com/getElections?api_key={self.api_key}"
-		data = await try_get_url(url)
+		url = f"{self.elections_url}/getElections?api_key={self.api_key}"
+		data = await self.cached_get('getElections', url)
 		return data
 
 	async def get_complaints_list(self, election_id) -> list:
-		url = f"https://elections.toncenter.com/getComplaints?election_id={election_id}&limit=100&api_key={self.api_key}"
-		data = await try_get_url(url)
+		url = f"{self.elections_url}/getComplaints?election_id={election_id}&limit=100&api_key={self.api_key}"
+		data = await self.cached_get('getComplaints', url, f'election_id={election_id}&limit=100')
 		return data
 
 	async def get_efficiency_list(self, election_id) -> list:
-		url = f"https://toncenter.com/api/qos/cycleScoreboard?cycle_id={election_id}&limit=1000"
-		data = await try_get_url(url)
+		url = f"{self.toncenter_url}/api/qos/cycleScoreboard?cycle_id={election_id}&limit=1000"
+		data = await self.cached_get('cycleScoreboard', url, f'cycle_id={election_id}&limit=1000')
 		return data['scoreboard']
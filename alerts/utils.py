@@ -1,9 +1,15 @@
-from typing import Optional
+import codecs
+import hashlib
+import json
+from typing import AsyncIterator, Optional
 
 
 def amount_formatting(amount):
 	return f"{amount:,}".replace(',', ' ')
 
+def fingerprint(*data) -> str:
+	return hashlib.blake2b(json.dumps(data, sort_keys=True, default=str).encode(), digest_size=16).hexdigest()
+
 def get_adnl_text(adnl_addr: str, label: Optional[str], cut: bool = True):
 	label_text = f" ({label})" if label else ''
 	if cut:
@@ -11,3 +17,53 @@ def get_adnl_text(adnl_addr: str, label: Optional[str], cut: bool = True):
 	else:
 		adnl_text = adnl_addr + label_text
 	return adnl_text
+
+
+NUMBER_CHARS = frozenset('0123456789.eE+-')
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator:
+	# yields the items of a top-level JSON array as soon as each of them is fully received
+	decoder = json.JSONDecoder()
+	text_decoder = codecs.getincrementaldecoder('utf-8')()
+	buffer = ''
+	pos = 0
+	started = finished = False
+	eof = False
+	chunks = chunks.__aiter__()
+	while not finished:
+		if not eof:
+			try:
+				chunk = await chunks.__anext__()
+				buffer = buffer[pos:] + text_decoder.decode(chunk)
+			except StopAsyncIteration:
+				buffer = buffer[pos:] + text_decoder.decode(b'', final=True)
+				eof = True
+			pos = 0
+		while True:
+			while pos < len(buffer) and (buffer[pos].isspace() or (started and buffer[pos] == ',')):
+				pos += 1
+			if pos >= len(buffer):
+				break
+			if not started:
+				if buffer[pos] != '[':
+					raise ValueError(f"Expected JSON array, got {buffer[pos]!r}")
+				started = True
+				pos += 1
+				continue
+			if buffer[pos] == ']':
+				finished = True
+				break
+			try:
+				item, end = decoder.raw_decode(buffer, pos)
+			except json.JSONDecodeError:
+				if eof:
+					raise
+				break
+			if not eof and (end == len(buffer) or (type(item) in (int, float) and buffer[end] in NUMBER_CHARS)):
+				# a number may continue in the next chunk, e.g. "-0" followed by ".5"
+				break
+			pos = end
+			yield item
+		if eof and not finished:
+			raise ValueError("Unexpected end of JSON array")
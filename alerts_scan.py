@@ -1,32 +1,42 @@
 import asyncio
-import logging
+from typing import Optional
 
 from aiogram import Bot
 
+from alerts.delivery import MessageDelivery
+from alerts.scan_context import ScanContext, DEFAULT_MAX_AGE
+from alerts.scheduler import AlertScheduler
+from alerts.shards import ShardLeases
 from alerts.toncenter import Toncenter
 from database import Database
 from alerts import ComplaintsAlert, TelemetryAlert, ElectionsInformation, ComplaintsInformation
 
 
-async def run_alerts_scanner(toncenter, db, bot):
-    while True:
-        try:
-            await scan(toncenter, db, bot)
-            await asyncio.sleep(30)
-        except Exception as e:
-            logging.error(f"Error in alerts scanner: {e}")
-            await asyncio.sleep(10)
+async def run_alerts_scanner(toncenter, db, bot, delivery: Optional[MessageDelivery] = None,
+                             shards: Optional[ShardLeases] = None, max_age: float = DEFAULT_MAX_AGE):
+    # every alert loads and flushes its own context on each of its runs
+    alerts = [
+        ComplaintsAlert(toncenter, db, bot, delivery=delivery, shards=shards, max_age=max_age),
+        TelemetryAlert(toncenter, db, bot, delivery=delivery, shards=shards, max_age=max_age),
+        ElectionsInformation(toncenter, db, bot, delivery=delivery, shards=shards, max_age=max_age),
+        ComplaintsInformation(toncenter, db, bot, delivery=delivery, shards=shards, max_age=max_age),
+    ]
+    await AlertScheduler(alerts).run()
 
 
-async def scan(toncenter: Toncenter, db_manager: Database, bot: Bot):
+async def scan(toncenter: Toncenter, db_manager: Database, bot: Bot, delivery: Optional[MessageDelivery] = None):
+    context = await ScanContext.load(db_manager)
     alerts = [
-        ComplaintsAlert(toncenter, db_manager, bot),
-        TelemetryAlert(toncenter, db_manager, bot),
-        ElectionsInformation(toncenter, db_manager, bot),
-        ComplaintsInformation(toncenter, db_manager, bot),
+        ComplaintsAlert(toncenter, db_manager, bot, context, delivery),
+        TelemetryAlert(toncenter, db_manager, bot, context, delivery),
+        ElectionsInformation(toncenter, db_manager, bot, context, delivery),
+        ComplaintsInformation(toncenter, db_manager, bot, context, delivery),
     ]
     tasks = []
     for alert in alerts:
         tasks.append(alert.run())
 
-    await asyncio.gather(*tasks, return_exceptions=True)
+    try:
+        await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await context.flush(db_manager, bot, delivery)
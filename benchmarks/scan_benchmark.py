@@ -0,0 +1,241 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Optional
+
+from aiohttp import web
+from sqlalchemy import event, insert, select, func
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import alerts_scan
+from alerts import ComplaintsAlert, TelemetryAlert, ElectionsInformation, ComplaintsInformation
+from alerts.alert import ALERTS
+from alerts.toncenter import Toncenter
+from database import Database, UserModel, NodeModel
+from database.models import AlertModel
+from fake_toncenter import SyntheticSource, create_app, make_adnl
+from handlers.add_node import MAX_NODES_PER_USER
+
+# seeds a database, serves synthetic toncenter data and runs the scan end to end, e.g.
+# python3 benchmarks/scan_benchmark.py --users 100000 --nodes-per-user 5 --output results.json
+
+ALERT_CLASSES = [ComplaintsAlert, TelemetryAlert, ElectionsInformation, ComplaintsInformation]
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = 0
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> None:
+        self.sent += 1
+
+
+class Measurement:
+    # wall time, SQL statements, toncenter requests, messages and peak traced memory of one phase
+    def __init__(self, app: web.Application, bot: FakeBot, queries: list[int], trace_memory: bool):
+        self.app = app
+        self.bot = bot
+        self.queries = queries
+        self.trace_memory = trace_memory
+        self.result: dict = {}
+
+    def __enter__(self) -> "Measurement":
+        self.started = time.perf_counter()
+        self.queries_before = self.queries[0]
+        self.requests_before = dict(self.app['requests'])
+        self.sent_before = self.bot.sent
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            self.memory_before = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        requests = {k: v - self.requests_before.get(k, 0) for k, v in self.app['requests'].items()}
+        self.result = {
+            'wall_time': round(time.perf_counter() - self.started, 4),
+            'queries': self.queries[0] - self.queries_before,
+            'http_calls': sum(requests.values()),
+            'http_calls_by_endpoint': {k: v for k, v in requests.items() if v},
+            'messages': self.bot.sent - self.sent_before,
+        }
+        if self.trace_memory:
+            self.result['peak_memory'] = tracemalloc.get_traced_memory()[1] - self.memory_before
+
+
+async def seed(db: Database, users: int, nodes_per_user: int, adnls: int, seed_value: int, batch_size: int = 5000) -> int:
+    rng = random.Random(seed_value)
+    now = datetime.datetime.now()
+    nodes_count = 0
+    async with db.session_maker() as session:
+        for start in range(1, users + 1, batch_size):
+            user_ids = range(start, min(users, start + batch_size - 1) + 1)
+            await session.execute(insert(UserModel), [
+                {'user_id': user_id, 'username': None, 'state': '', 'date_joined': now} for user_id in user_ids
+            ])
+            await session.execute(insert(AlertModel), [
+                {'user_id': user_id, 'alert_type': alert_type, 'enabled': True}
+                for user_id in user_ids for alert_type in ALERTS
+            ])
+            # a user can add an ADNL only once, as in the add_node handler
+            nodes = [
+                {'user_id': user_id, 'adnl': make_adnl(index), 'label': None}
+                for user_id in user_ids
+                for index in rng.sample(range(adnls), min(adnls, rng.randint(1, nodes_per_user)))
+            ]
+            await session.execute(insert(NodeModel), nodes)
+            nodes_count += len(nodes)
+        await session.commit()
+    return nodes_count
+
+
+def reset_state(db: Database) -> None:
+    # every phase starts cold, as after a restart
+    db.subscriptions = None
+    db.triggered = None
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> dict:
+    database_url = args.database_url
+    if database_url is None:
+        database_url = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}"
+    db = Database(database_url)
+    await db.init_db()
+    async with db.session_maker() as session:
+        if await session.scalar(select(func.count(UserModel.user_id))):
+            raise SystemExit(f"{database_url} is not empty, the benchmark needs an empty database")
+
+    adnls = args.telemetry_nodes or args.users * args.nodes_per_user
+    started = time.perf_counter()
+    nodes_count = await seed(db, args.users, args.nodes_per_user, adnls, args.seed)
+    seed_time = time.perf_counter() - started
+
+    source = SyntheticSource(args.validators, adnls, args.overloaded_ratio, args.complaints, seed=args.seed)
+    app = create_app(source)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    base_url = 'http://%s:%d' % runner.addresses[0][:2]
+
+    queries = [0]
+
+    def count_query(*_):
+        queries[0] += 1
+
+    event.listen(db.engine.sync_engine, 'before_cursor_execute', count_query)
+    bot = FakeBot()
+    if args.trace_memory:
+        tracemalloc.start()
+
+    results = {
+        'meta': {
+            'commit': get_commit(),
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'database': database_url.split(':', 1)[0],
+            'users': args.users,
+            'nodes_per_user': args.nodes_per_user,
+            'nodes': nodes_count,
+            'telemetry_nodes': adnls,
+            'validators': args.validators,
+            'seed_time': round(seed_time, 2),
+            'trace_memory': args.trace_memory,
+        },
+        'alerts': {},
+        'scan': [],
+    }
+    try:
+        for alert_class in ALERT_CLASSES:
+            reset_state(db)
+            toncenter = Toncenter('benchmark', base_url=base_url, requests_per_second=1000)
+            alert = alert_class(toncenter, db, bot)
+            with Measurement(app, bot, queries, args.trace_memory) as measurement:
+                await alert.run()
+            await toncenter.close()
+            results['alerts'][alert_class.__name__] = measurement.result
+
+        # the same alerts again end to end, later cycles show the steady state
+        await db.apply_triggered_alerts([], list(await db.get_all_triggered_alerts()))
+        reset_state(db)
+        toncenter = Toncenter('benchmark', base_url=base_url, requests_per_second=1000)
+        for cycle in range(args.cycles):
+            if cycle:
+                # as if the next scan ran `interval` seconds later: cached responses expired, nodes sent new reports
+                source.offset += args.interval
+                toncenter.cache.invalidate()
+            with Measurement(app, bot, queries, args.trace_memory) as measurement:
+                await alerts_scan.scan(toncenter, db, bot)
+            results['scan'].append(measurement.result)
+        await toncenter.close()
+    finally:
+        if args.trace_memory:
+            tracemalloc.stop()
+        await runner.cleanup()
+        await db.close()
+    return results
+
+
+def compare(results: dict, baseline: dict) -> list[str]:
+    lines = []
+    rows = [(f"alerts.{name}", result, baseline.get('alerts', {}).get(name)) for name, result in results['alerts'].items()]
+    base_scan = baseline.get('scan', [])
+    rows += [(f"scan[{i}]", result, base_scan[i] if i < len(base_scan) else None) for i, result in enumerate(results['scan'])]
+    for name, result, base in rows:
+        if not base:
+            continue
+        for key in ('wall_time', 'queries', 'http_calls', 'messages', 'peak_memory'):
+            if key not in result or key not in base:
+                continue
+            change = (result[key] - base[key]) / base[key] * 100 if base[key] else 0.0
+            lines.append(f"{name:32} {key:12} {base[key]:>14} -> {result[key]:>14} ({change:+.1f}%)")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End to end benchmark of the alerts scan")
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--nodes-per-user', type=int, default=3, help=f"Each user gets 1..N nodes, N <= {MAX_NODES_PER_USER}")
+    parser.add_argument('--telemetry-nodes', type=int, help="Distinct ADNLs, users * nodes-per-user by default")
+    parser.add_argument('--validators', type=int, default=400)
+    parser.add_argument('--overloaded-ratio', type=float, default=0.05)
+    parser.add_argument('--complaints', type=int, default=10)
+    parser.add_argument('--cycles', type=int, default=2, help="End to end scans to run after the per alert runs")
+    parser.add_argument('--interval', type=int, default=30, help="Seconds between emulated scan cycles")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database-url', help="Empty database to use, a temporary SQLite file by default")
+    parser.add_argument('--no-trace-memory', dest='trace_memory', action='store_false',
+                        help="Skip tracemalloc, it slows the scan down noticeably")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    parser.add_argument('--compare', help="Results of a previous run to compare with")
+    args = parser.parse_args()
+    if not 1 <= args.nodes_per_user <= MAX_NODES_PER_USER:
+        parser.error(f"--nodes-per-user must be between 1 and {MAX_NODES_PER_USER}")
+
+    results = asyncio.run(run(args))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            print('\n'.join(compare(results, json.load(f))), file=sys.stderr)
@@ -7,6 +7,7 @@ from aiogram import Bot, Dispatcher, Router
 from aiogram.types import Message
 from aiogram.types import BotCommand, BotCommandScopeAllPrivateChats
 
+from alerts.broadcast import BroadcastEngine
 from alerts.toncenter import Toncenter
 from database import Database
 from handlers import (add_node_router, menu_router, edit_node_router, notifications_router, admin_router,
@@ -14,6 +15,7 @@ from handlers import (add_node_router, menu_router, edit_node_router, notificati
 
 from dotenv import load_dotenv
 
+from handlers.admin import resume_broadcasts
 from handlers.edit_nodes import edit_label_message_handler
 
 load_dotenv()
@@ -50,12 +52,13 @@ async def message_handler(message: Message, db_manager: Database, toncenter: Ton
         await message.answer(text=TEXTS['unknown_command'])
 
 
-async def run_bot(bot: Bot, db: Database, toncenter: Toncenter) -> None:
+async def run_bot(bot: Bot, db: Database, toncenter: Toncenter, broadcaster: BroadcastEngine) -> None:
     # bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
     # db = Database()
     # await db.init_db()
 
-    dp = Dispatcher(session_maker=None, db_manager=db, toncenter=toncenter, admin_users=admin_users)
+    dp = Dispatcher(session_maker=None, db_manager=db, toncenter=toncenter, admin_users=admin_users,
+                    broadcaster=broadcaster)
     dp.include_router(menu_router)
     dp.include_router(edit_node_router)
     dp.include_router(notifications_router)
@@ -64,6 +67,8 @@ async def run_bot(bot: Bot, db: Database, toncenter: Toncenter) -> None:
     dp.include_router(router)
 
     dp.startup.register(set_default_commands)
+    dp.startup.register(resume_broadcasts)
+    dp.shutdown.register(broadcaster.shutdown)
     dp.shutdown.register(db.close)
 
     # And the run events dispatching
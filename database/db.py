@@ -1,18 +1,33 @@
+import asyncio
 import datetime
+import json
 import time
+from typing import Any, Callable, Optional
 
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker, AsyncEngine
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update, delete, insert, tuple_, func
+from sqlalchemy.exc import IntegrityError
 
-from database.models import Base, UserModel, NodeModel, TriggeredAlert, AlertModel
+from database.models import (Base, UserModel, NodeModel, TriggeredAlert, AlertModel, BlockedUser, BroadcastModel,
+                             ScannerWorker, ShardLease, UpstreamResponse)
+from database.subscriptions import SubscriptionIndex
+from database.triggered import TriggeredAlerts
+from metrics import DB_METHOD_SECONDS, timed_methods, watch_engine
 
 
+@timed_methods(DB_METHOD_SECONDS)
 class Database:
     def __init__(self, db_url: str):
         self.engine: AsyncEngine = create_async_engine(db_url)
+        watch_engine(self.engine)
         self.session_maker: async_sessionmaker[AsyncSession] = async_sessionmaker(
             self.engine, class_=AsyncSession, expire_on_commit=False, autoflush=False
         )
+        self.subscriptions: Optional[SubscriptionIndex] = None
+        # changes made while the subscriptions are being reloaded, replayed onto the reloaded index
+        self.subscription_changes: Optional[list[Callable[[SubscriptionIndex], None]]] = None
+        self._subscriptions_lock = asyncio.Lock()
+        self.triggered: Optional[TriggeredAlerts] = None
 
     async def init_db(self):
         async with self.engine.begin() as conn:
@@ -59,6 +74,10 @@ class Database:
                 session.add(alert_model)
             await session.commit()
             await session.refresh(user)
+            def enable_all(index: SubscriptionIndex) -> None:
+                for alert_type in ALERTS:
+                    index.set_alert_enabled(user, alert_type, True)
+            self.change_subscriptions(enable_all)
             return user
 
     async def get_users(self):
@@ -99,6 +118,7 @@ class Database:
             )
             session.add(node)
             await session.commit()
+            self.change_subscriptions(lambda index: index.add_node(node))
 
     async def set_node_label(self, user_id: int, node_adnl: str, label: str) -> None:
         async with self.session_maker() as session:
@@ -108,6 +128,7 @@ class Database:
                 .values({'label': label})
             )
             await session.commit()
+        self.change_subscriptions(lambda index: index.set_node_label(user_id, node_adnl, label))
 
     async def get_node_by_id(self, node_id: int) -> NodeModel | None:
         async with self.session_maker() as session:
@@ -120,6 +141,7 @@ class Database:
         async with self.session_maker() as session:
             await session.execute(delete(NodeModel).filter(NodeModel.id == node_id))
             await session.commit()
+        self.change_subscriptions(lambda index: index.remove_node(node_id))
 
     async def get_triggered_alerts(self, user_id: int, alert_name: str) -> list[TriggeredAlert]:
         async with self.session_maker() as session:
@@ -145,6 +167,164 @@ class Database:
             await session.execute(delete(TriggeredAlert).filter(TriggeredAlert.alert_name == alert_name, TriggeredAlert.user_id == user_id))
             await session.commit()
 
+    async def set_user_blocked(self, user_id: int, blocked: bool) -> None:
+        async with self.session_maker() as session:
+            if blocked:
+                if await session.get(BlockedUser, user_id) is None:
+                    session.add(BlockedUser(user_id=user_id, timestamp=int(time.time())))
+            else:
+                await session.execute(delete(BlockedUser).filter(BlockedUser.user_id == user_id))
+            await session.commit()
+        self.change_subscriptions(lambda index: index.set_user_blocked(user_id, blocked))
+
+    async def get_recipients(self, after_user_id: int = 0, limit: int = 500) -> list[int]:
+        async with self.session_maker() as session:
+            result = await session.scalars(
+                select(UserModel.user_id)
+                .where(UserModel.user_id > after_user_id, UserModel.user_id.not_in(select(BlockedUser.user_id)))
+                .order_by(UserModel.user_id)
+                .limit(limit)
+            )
+            return list(result.all())
+
+    async def count_recipients(self, after_user_id: int = 0) -> int:
+        async with self.session_maker() as session:
+            return await session.scalar(
+                select(func.count(UserModel.user_id))
+                .where(UserModel.user_id > after_user_id, UserModel.user_id.not_in(select(BlockedUser.user_id)))
+            )
+
+    async def add_broadcast(self, text: str, created_by: int) -> BroadcastModel:
+        async with self.session_maker() as session:
+            broadcast = BroadcastModel(text=text, created_by=created_by, created_at=int(time.time()), status='running',
+                                       last_user_id=0, total=0, sent=0, blocked=0, failed=0)
+            session.add(broadcast)
+            await session.commit()
+            await session.refresh(broadcast)
+            return broadcast
+
+    async def get_running_broadcasts(self) -> list[BroadcastModel]:
+        async with self.session_maker() as session:
+            result = await session.scalars(select(BroadcastModel).filter(BroadcastModel.status == 'running').order_by(BroadcastModel.id))
+            return list(result.all())
+
+    async def update_broadcast(self, broadcast: BroadcastModel) -> None:
+        async with self.session_maker() as session:
+            await session.execute(
+                update(BroadcastModel)
+                .filter(BroadcastModel.id == broadcast.id)
+                .values({
+                    'status': broadcast.status,
+                    'last_user_id': broadcast.last_user_id,
+                    'total': broadcast.total,
+                    'sent': broadcast.sent,
+                    'blocked': broadcast.blocked,
+                    'failed': broadcast.failed,
+                })
+            )
+            await session.commit()
+
+    async def heartbeat_scanner_worker(self, worker_id: str, timeout: int) -> list[str]:
+        # returns ids of the live workers, this one included
+        now = int(time.time())
+        async with self.session_maker() as session:
+            await session.merge(ScannerWorker(worker_id=worker_id, heartbeat_at=now))
+            await session.execute(delete(ScannerWorker).where(ScannerWorker.heartbeat_at < now - timeout))
+            result = await session.scalars(select(ScannerWorker.worker_id).order_by(ScannerWorker.worker_id))
+            workers = list(result.all())
+            await session.commit()
+            return workers
+
+    async def remove_scanner_worker(self, worker_id: str) -> None:
+        async with self.session_maker() as session:
+            await session.execute(delete(ScannerWorker).where(ScannerWorker.worker_id == worker_id))
+            await session.commit()
+
+    async def init_shard_leases(self, shards: int) -> None:
+        async with self.session_maker() as session:
+            existing = set((await session.scalars(select(ShardLease.shard))).all())
+            await session.execute(delete(ShardLease).where(ShardLease.shard >= shards))
+            missing = [{'shard': shard, 'worker_id': None, 'expires_at': 0} for shard in range(shards) if shard not in existing]
+            if missing:
+                await session.execute(insert(ShardLease), missing)
+            try:
+                await session.commit()
+            except IntegrityError:
+                pass  # created by another worker at the same time
+
+    async def renew_shard_leases(self, worker_id: str, expires_at: int) -> set[int]:
+        now = int(time.time())
+        async with self.session_maker() as session:
+            await session.execute(
+                update(ShardLease)
+                .where(ShardLease.worker_id == worker_id, ShardLease.expires_at > now)
+                .values(expires_at=expires_at)
+            )
+            result = await session.scalars(
+                select(ShardLease.shard).where(ShardLease.worker_id == worker_id, ShardLease.expires_at > now)
+            )
+            shards = set(result.all())
+            await session.commit()
+            return shards
+
+    async def claim_shard_leases(self, worker_id: str, count: int, expires_at: int) -> set[int]:
+        now = int(time.time())
+        claimed = set()
+        async with self.session_maker() as session:
+            result = await session.scalars(select(ShardLease.shard).where(ShardLease.expires_at <= now).order_by(ShardLease.shard))
+            for shard in result.all():
+                if len(claimed) >= count:
+                    break
+                # the condition is checked again by the update in case another worker claimed the shard first
+                result = await session.execute(
+                    update(ShardLease)
+                    .where(ShardLease.shard == shard, ShardLease.expires_at <= now)
+                    .values(worker_id=worker_id, expires_at=expires_at)
+                )
+                if result.rowcount:
+                    claimed.add(shard)
+            await session.commit()
+        return claimed
+
+    async def release_shard_leases(self, worker_id: str, shards: set[int], available_at: int) -> None:
+        async with self.session_maker() as session:
+            await session.execute(
+                update(ShardLease)
+                .where(ShardLease.worker_id == worker_id, ShardLease.shard.in_(shards))
+                .values(worker_id=None, expires_at=available_at)
+            )
+            await session.commit()
+
+    async def get_upstream_response(self, key: str, max_age: float) -> Optional[Any]:
+        async with self.session_maker() as session:
+            response = await session.get(UpstreamResponse, key)
+            if response is None or time.time() - response.fetched_at > max_age:
+                return None
+            return json.loads(response.data)
+
+    async def set_upstream_response(self, key: str, data: Any) -> None:
+        async with self.session_maker() as session:
+            await session.merge(UpstreamResponse(key=key, fetched_at=int(time.time()), data=json.dumps(data)))
+            await session.commit()
+
+    async def get_all_triggered_alerts(self) -> set[tuple[int, str]]:
+        async with self.session_maker() as session:
+            result = await session.execute(select(TriggeredAlert.user_id, TriggeredAlert.alert_name))
+            return {(user_id, alert_name) for user_id, alert_name in result.all()}
+
+    async def apply_triggered_alerts(self, added: list[tuple[int, str, int]], deleted: list[tuple[int, str]], batch_size: int = 500) -> None:
+        async with self.session_maker() as session:
+            for i in range(0, len(deleted), batch_size):
+                await session.execute(delete(TriggeredAlert).where(
+                    tuple_(TriggeredAlert.user_id, TriggeredAlert.alert_name).in_(deleted[i:i + batch_size])
+                ))
+            if added:
+                await session.execute(insert(TriggeredAlert), [
+                    {'user_id': user_id, 'alert_name': alert_name, 'timestamp': timestamp}
+                    for user_id, alert_name, timestamp in added
+                ])
+            await session.commit()
+
     async def get_user_alerts(self, user_id: int):
         async with self.session_maker() as session:
             alerts = await session.scalars(
@@ -160,6 +340,10 @@ class Database:
                 .values({'enabled': enabled})
             )
             await session.commit()
+        if self.subscriptions is not None or self.subscription_changes is not None:
+            user = (self.subscriptions and self.subscriptions.users.get(user_id)) or await self.get_user(user_id)
+            if user is not None:
+                self.change_subscriptions(lambda index: index.set_alert_enabled(user, alert_type, enabled))
 
     async def get_users_with_enabled_alert(self, alert_type: str, only_with_nodes: bool = True) -> list[UserModel]:
         async with (self.session_maker() as session):
@@ -186,5 +370,53 @@ class Database:
             result = await session.scalars(query)
             return list(result.all())
 
+    async def get_alert_subscriptions(self) -> tuple[list[tuple[UserModel, str]], list[NodeModel], set[int]]:
+        async with self.session_maker() as session:
+            alerts = await session.execute(
+                select(UserModel, AlertModel.alert_type).join(
+                    AlertModel,
+                    UserModel.user_id == AlertModel.user_id
+                ).where(
+                    AlertModel.enabled == True
+                )
+            )
+            nodes = await session.scalars(select(NodeModel))
+            blocked = await session.scalars(select(BlockedUser.user_id))
+            return [(user, alert_type) for user, alert_type in alerts.all()], list(nodes.all()), set(blocked.all())
+
+    def change_subscriptions(self, change: Callable[[SubscriptionIndex], None]) -> None:
+        if self.subscriptions is not None:
+            change(self.subscriptions)
+        if self.subscription_changes is not None:
+            self.subscription_changes.append(change)
+
+    async def get_subscriptions(self, max_age: Optional[float] = None) -> SubscriptionIndex:
+        async with self._subscriptions_lock:
+            if self.subscriptions is None or (max_age is not None and time.time() - self.subscriptions.loaded_at > max_age):
+                # the queries may miss changes committed while they run, those are recorded and replayed
+                self.subscription_changes = []
+                try:
+                    subscriptions, nodes, blocked = await self.get_alert_subscriptions()
+                finally:
+                    changes, self.subscription_changes = self.subscription_changes, None
+                loaded = SubscriptionIndex(subscriptions, nodes, blocked)
+                for change in changes:
+                    change(loaded)
+                if self.subscriptions is None:
+                    self.subscriptions = loaded
+                else:
+                    self.subscriptions.update(loaded)
+            return self.subscriptions
+
+    async def get_triggered(self) -> TriggeredAlerts:
+        # only this process writes the rows of its users, memory is re-read when it is marked expired
+        if self.triggered is None:
+            names = await self.get_all_triggered_alerts()
+            if self.triggered is None:
+                self.triggered = TriggeredAlerts(names)
+        elif self.triggered.expired:
+            await self.triggered.reload(self)
+        return self.triggered
+
     async def close(self):
         await self.engine.dispose()
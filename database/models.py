@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import String, BigInteger, DateTime, ARRAY, ForeignKey, Index
+from sqlalchemy import String, BigInteger, DateTime, ARRAY, ForeignKey, Index, Text
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -47,3 +47,48 @@ class TriggeredAlert(Base):
     user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.user_id"))
     alert_name = mapped_column(String(32), index=True)
     timestamp = mapped_column(BigInteger)
+
+
+class BlockedUser(Base):
+    __tablename__ = "blocked_users"
+
+    user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.user_id"), primary_key=True)
+    timestamp = mapped_column(BigInteger)
+
+
+class BroadcastModel(Base):
+    __tablename__ = "broadcasts"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    text: Mapped[str] = mapped_column(Text)
+    status: Mapped[str] = mapped_column(String(16), default="running")
+    created_by: Mapped[Optional[int]] = mapped_column(BigInteger)
+    created_at = mapped_column(BigInteger)
+    last_user_id: Mapped[int] = mapped_column(BigInteger, default=0)  # every user up to this one has been processed
+    total: Mapped[int] = mapped_column(default=0)
+    sent: Mapped[int] = mapped_column(default=0)
+    blocked: Mapped[int] = mapped_column(default=0)
+    failed: Mapped[int] = mapped_column(default=0)
+
+
+class ScannerWorker(Base):
+    __tablename__ = "scanner_workers"
+
+    worker_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    heartbeat_at = mapped_column(BigInteger)
+
+
+class ShardLease(Base):
+    __tablename__ = "shard_leases"
+
+    shard: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    worker_id: Mapped[Optional[str]] = mapped_column(String(64))
+    expires_at: Mapped[int] = mapped_column(BigInteger, default=0)  # free to claim by any worker after this time
+
+
+class UpstreamResponse(Base):
+    __tablename__ = "upstream_responses"
+
+    key: Mapped[str] = mapped_column(String(256), primary_key=True)
+    fetched_at = mapped_column(BigInteger)
+    data: Mapped[str] = mapped_column(Text)
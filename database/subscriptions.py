@@ -0,0 +1,123 @@
+import bisect
+import time
+from collections import defaultdict
+
+from database.models import UserModel, NodeModel
+
+
+class SubscriptionIndex:
+    # adnl -> (user, node) subscriptions, kept in sync by the Database methods that change nodes and alerts
+    def __init__(self, subscriptions: list[tuple[UserModel, str]], nodes: list[NodeModel], blocked: set[int] = None):
+        self.loaded_at = time.time()
+        self.blocked: set[int] = blocked or set()
+        self.users: dict[int, UserModel] = {}
+        self.alerts: dict[str, set[int]] = defaultdict(set)
+        self.nodes: dict[int, NodeModel] = {}
+        self.user_nodes: dict[int, dict[str, NodeModel]] = defaultdict(dict)
+        self.by_adnl: dict[str, dict[int, NodeModel]] = defaultdict(dict)
+        for user, alert_type in subscriptions:
+            self.users[user.user_id] = user
+            self.alerts[alert_type].add(user.user_id)
+        # bumped on every change, (version, user_id) of subscriptions added since the index was loaded
+        self.version = 0
+        self.added: list[tuple[int, int]] = []
+        for node in nodes:
+            self.index_node(node)
+
+    def record_added(self, user_id: int) -> None:
+        self.version += 1
+        self.added.append((self.version, user_id))
+
+    def get_added_users(self, since_version: int) -> set[int]:
+        start = bisect.bisect_right(self.added, (since_version, float('inf')))
+        return {user_id for _, user_id in self.added[start:]}
+
+    def index_node(self, node: NodeModel) -> None:
+        self.nodes[node.id] = node
+        self.user_nodes[node.user_id][node.adnl] = node
+        self.by_adnl[node.adnl][node.user_id] = node
+
+    def add_node(self, node: NodeModel) -> None:
+        self.index_node(node)
+        self.record_added(node.user_id)
+
+    def remove_node(self, node_id: int) -> None:
+        node = self.nodes.pop(node_id, None)
+        if node is None:
+            return
+        user_nodes = self.user_nodes.get(node.user_id, {})
+        user_nodes.pop(node.adnl, None)
+        if not user_nodes:
+            self.user_nodes.pop(node.user_id, None)
+        subscribers = self.by_adnl.get(node.adnl, {})
+        subscribers.pop(node.user_id, None)
+        if not subscribers:
+            self.by_adnl.pop(node.adnl, None)
+        self.version += 1
+
+    def update(self, loaded: "SubscriptionIndex") -> None:
+        # applies what a reload found to this index in place, so that an unchanged reload changes no version
+        self.loaded_at = loaded.loaded_at
+        for node_id in self.nodes.keys() - loaded.nodes.keys():
+            self.remove_node(node_id)
+        for node_id, node in loaded.nodes.items():
+            current = self.nodes.get(node_id)
+            if current is None:
+                self.add_node(node)
+            elif current.label != node.label:
+                current.label = node.label
+        for alert_type in self.alerts.keys() | loaded.alerts.keys():
+            enabled, loaded_enabled = self.alerts.get(alert_type, set()), loaded.alerts.get(alert_type, set())
+            for user_id in loaded_enabled - enabled:
+                self.set_alert_enabled(loaded.users[user_id], alert_type, True)
+            for user_id in enabled - loaded_enabled:
+                self.set_alert_enabled(self.users[user_id], alert_type, False)
+        for user_id in loaded.blocked - self.blocked:
+            self.set_user_blocked(user_id, True)
+        for user_id in self.blocked - loaded.blocked:
+            self.set_user_blocked(user_id, False)
+
+    def set_node_label(self, user_id: int, adnl: str, label: str) -> None:
+        node = self.user_nodes.get(user_id, {}).get(adnl)
+        if node is not None:
+            node.label = label
+
+    def set_alert_enabled(self, user: UserModel, alert_type: str, enabled: bool) -> None:
+        if enabled:
+            self.users.setdefault(user.user_id, user)
+            self.alerts[alert_type].add(user.user_id)
+            self.record_added(user.user_id)
+        else:
+            self.alerts[alert_type].discard(user.user_id)
+            self.version += 1
+
+    def set_user_blocked(self, user_id: int, blocked: bool) -> None:
+        if blocked:
+            self.blocked.add(user_id)
+            self.version += 1
+        elif user_id in self.blocked:
+            self.blocked.discard(user_id)
+            self.record_added(user_id)
+
+    def is_enabled(self, user_id: int, alert_type: str) -> bool:
+        return user_id in self.alerts.get(alert_type, ()) and user_id not in self.blocked
+
+    def get_users(self, alert_type: str, only_with_nodes: bool = True) -> list[UserModel]:
+        user_ids = self.alerts.get(alert_type, set()) - self.blocked
+        if only_with_nodes:
+            return [self.users[user_id] for user_id in user_ids if user_id in self.user_nodes]
+        return [self.users[user_id] for user_id in user_ids]
+
+    def get_user_nodes(self, user_id: int) -> list[NodeModel]:
+        return sorted(self.user_nodes.get(user_id, {}).values(), key=lambda n: n.id)
+
+    def get_adnls(self) -> list[str]:
+        return list(self.by_adnl)
+
+    def get_subscribers(self, adnl: str, alert_type: str) -> list[tuple[UserModel, NodeModel]]:
+        enabled = self.alerts.get(alert_type, set())
+        return [
+            (self.users[user_id], node)
+            for user_id, node in self.by_adnl.get(adnl, {}).items()
+            if user_id in enabled and user_id not in self.blocked
+        ]
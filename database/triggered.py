@@ -0,0 +1,97 @@
+import asyncio
+import time
+from collections import Counter
+from typing import Callable
+
+
+class TriggeredAlerts:
+    # triggered_alerts rows kept in memory between scans, changes are written behind in batches by flush()
+    def __init__(self, names: set[tuple[int, str]]):
+        self.expired = False
+        # bumped when a reload finds rows that differ from memory
+        self.generation = 0
+        self.names = names
+        # alert_name -> number of users it is triggered for
+        self.counts: Counter[str] = Counter(alert_name for _, alert_name in names)
+        self.added: dict[tuple[int, str], int] = {}
+        self.deleted: set[tuple[int, str]] = set()
+        self._flush_lock = asyncio.Lock()
+
+    def __contains__(self, key: tuple[int, str]) -> bool:
+        return key in self.names
+
+    @property
+    def pending(self) -> bool:
+        return bool(self.added or self.deleted)
+
+    def count(self, alert_name: str) -> int:
+        return self.counts.get(alert_name, 0)
+
+    def add(self, user_id: int, alert_name: str) -> None:
+        key = (user_id, alert_name)
+        if key in self.names:
+            return
+        self.names.add(key)
+        self.counts[alert_name] += 1
+        if key in self.deleted:
+            self.deleted.discard(key)
+        else:
+            self.added[key] = int(time.time())
+
+    def remove(self, user_id: int, alert_name: str) -> None:
+        key = (user_id, alert_name)
+        if key not in self.names:
+            return
+        self.names.discard(key)
+        self.counts[alert_name] -= 1
+        if not self.counts[alert_name]:
+            del self.counts[alert_name]
+        if key in self.added:
+            del self.added[key]
+        else:
+            self.deleted.add(key)
+
+    def discard_pending(self, keep: Callable[[int], bool]) -> None:
+        # unwritten changes of users not kept are dropped, memory is reloaded from the database on the next scan
+        added = {key: timestamp for key, timestamp in self.added.items() if keep(key[0])}
+        deleted = {key for key in self.deleted if keep(key[0])}
+        if len(added) != len(self.added) or len(deleted) != len(self.deleted):
+            self.added, self.deleted = added, deleted
+            self.expired = True
+
+    async def reload(self, database) -> None:
+        # refreshes the rows in place, after any running flush, and keeps the changes that are still unwritten
+        async with self._flush_lock:
+            names = await database.get_all_triggered_alerts()
+            names -= self.deleted
+            names |= self.added.keys()
+            if names != self.names:
+                self.generation += 1
+            self.names = names
+            self.counts = Counter(alert_name for _, alert_name in names)
+            self.expired = False
+
+    async def flush(self, database) -> None:
+        # flushes run one at a time so that an older batch never overwrites a newer one
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            added, deleted = self.added, self.deleted
+            self.added, self.deleted = {}, set()
+            try:
+                await database.apply_triggered_alerts(
+                    [(user_id, alert_name, timestamp) for (user_id, alert_name), timestamp in added.items()],
+                    list(deleted),
+                )
+            except Exception:
+                # the database still holds the keys of the failed batch as before it, their pending changes are
+                # recomputed from that and from the current state, which includes changes made during the flush
+                for key in added.keys() | deleted:
+                    in_database = key in deleted
+                    timestamp = self.added.pop(key, None) or added.get(key)
+                    self.deleted.discard(key)
+                    if key in self.names and not in_database:
+                        self.added[key] = timestamp
+                    elif key not in self.names and in_database:
+                        self.deleted.add(key)
+                raise
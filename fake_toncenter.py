@@ -0,0 +1,214 @@
+import argparse
+import inspect
+import json
+import os
+import random
+import time
+from typing import Optional
+
+import aiohttp
+from aiohttp import web
+
+# run the bot against it with TONCENTER_BASE_URL=http://127.0.0.1:8081
+
+UPSTREAMS = {
+    'getTelemetryData': 'https://telemetry.toncenter.com/getTelemetryData',
+    'getValidationCycles': 'https://elections.toncenter.com/getValidationCycles',
+    'getElections': 'https://elections.toncenter.com/getElections',
+    'getComplaints': 'https://elections.toncenter.com/getComplaints',
+    'cycleScoreboard': 'https://toncenter.com/api/qos/cycleScoreboard',
+}
+
+ROUTES = {
+    '/getTelemetryData': 'getTelemetryData',
+    '/getValidationCycles': 'getValidationCycles',
+    '/getElections': 'getElections',
+    '/getComplaints': 'getComplaints',
+    '/api/qos/cycleScoreboard': 'cycleScoreboard',
+}
+
+VOLATILE_PARAMS = {'api_key', 'timestamp_from'}
+
+
+def fixture_key(query) -> str:
+    return '&'.join(f'{k}={v}' for k, v in sorted(query.items()) if k not in VOLATILE_PARAMS)
+
+
+def make_adnl(index: int) -> str:
+    return f'{index:064X}'
+
+
+def filter_telemetry(entries: list[dict], query) -> list[dict]:
+    timestamp_from = int(query.get('timestamp_from', 0))
+    adnl = query.get('adnl_address')
+    return [e for e in entries if e['timestamp'] >= timestamp_from and (adnl is None or e['adnl_address'] == adnl)]
+
+
+class SyntheticSource:
+    def __init__(self, validators: int = 400, telemetry_nodes: int = 1000, overloaded_ratio: float = 0.05,
+                 complaints: int = 10, report_interval: int = 60, seed: int = 0):
+        self.validators = validators
+        self.telemetry_nodes = telemetry_nodes
+        self.overloaded_ratio = overloaded_ratio
+        self.complaints = complaints
+        self.report_interval = report_interval
+        self.random = random.Random(seed)
+        # added to the clock, the benchmark moves it forward between scans instead of sleeping
+        self.offset = 0
+        self.overloaded = set(self.random.sample(range(telemetry_nodes), int(telemetry_nodes * overloaded_ratio)))
+        now = int(time.time())
+        cycle_length = 65536
+        self.current_cycle_id = now - now % cycle_length
+        self.past_cycle_id = self.current_cycle_id - cycle_length
+        self.cycle_length = cycle_length
+
+    def telemetry_entry(self, index: int, now: int) -> dict:
+        overloaded = index in self.overloaded
+        load = 15.5 if overloaded else 2.5
+        return {
+            'adnl_address': make_adnl(index),
+            # every node reports once per report_interval, spread over the interval
+            'timestamp': now - (now + index) % self.report_interval,
+            'data': {
+                'validatorStatus': {'out_of_sync': 120 if overloaded else 5},
+                'cpuLoad': [load, load, load],
+                'cpuNumber': 16,
+                'memory': {'usage': 120 if overloaded else 40, 'total': 128},
+                'netLoad': [600 if overloaded else 100] * 3,
+                'validatorDiskName': '/dev/nvme0n1',
+                'disksLoad': {'nvme0n1': [50, 50, 50]},
+                'disksLoadPercent': {'nvme0n1': [95 if overloaded else 30] * 3},
+            },
+        }
+
+    def cycle(self, cycle_id: int) -> dict:
+        return {
+            'cycle_id': cycle_id,
+            'cycle_info': {
+                'utime_since': cycle_id,
+                'utime_until': cycle_id + self.cycle_length,
+                'validators': [
+                    {'adnl_addr': make_adnl(i), 'index': i, 'stake': 700_000 * 10**9} for i in range(self.validators)
+                ],
+            },
+        }
+
+    def get(self, endpoint: str, query) -> object:
+        now = int(time.time()) + self.offset
+        if endpoint == 'getTelemetryData':
+            entries = [self.telemetry_entry(i, now) for i in range(self.telemetry_nodes)]
+            return filter_telemetry(entries, query)
+        if endpoint == 'getValidationCycles':
+            return [self.cycle(self.current_cycle_id), self.cycle(self.past_cycle_id)][:int(query.get('limit', 2))]
+        if endpoint == 'getElections':
+            return [{
+                'election_id': self.current_cycle_id + self.cycle_length,
+                'finished': False,
+                'participants_list': [
+                    {'adnl_addr': make_adnl(i), 'stake': 700_000 * 10**9} for i in range(0, self.validators, 2)
+                ],
+            }]
+        if endpoint == 'getComplaints':
+            election_id = int(query.get('election_id', self.past_cycle_id))
+            return [
+                {'election_id': election_id, 'adnl_addr': make_adnl(i), 'is_passed': True,
+                 'suggested_fine': 101 * 10**9}
+                for i in range(min(self.complaints, self.validators))
+            ]
+        if endpoint == 'cycleScoreboard':
+            return {'scoreboard': [
+                {'adnl_addr': make_adnl(i), 'efficiency': 100 - 100 * (i < self.complaints)}
+                for i in range(self.validators)
+            ]}
+        raise web.HTTPNotFound()
+
+
+class FixtureSource:
+    def __init__(self, fixtures_dir: str):
+        self.fixtures: dict[str, dict] = {}
+        for endpoint in UPSTREAMS:
+            path = os.path.join(fixtures_dir, f'{endpoint}.json')
+            if os.path.exists(path):
+                with open(path) as f:
+                    self.fixtures[endpoint] = json.load(f)
+
+    def get(self, endpoint: str, query) -> object:
+        recorded = self.fixtures.get(endpoint)
+        if not recorded:
+            raise web.HTTPNotFound()
+        key = fixture_key(query)
+        if endpoint == 'getTelemetryData':
+            # recorded reports are replayed as if they were sent just now
+            now = int(time.time())
+            entries = [{**e, 'timestamp': now} for e in recorded.get(key, recorded.get('', []))]
+            return filter_telemetry(entries, query)
+        if key in recorded:
+            return recorded[key]
+        return next(iter(recorded.values()))
+
+
+class RecordingSource:
+    def __init__(self, fixtures_dir: str):
+        self.fixtures_dir = fixtures_dir
+        os.makedirs(fixtures_dir, exist_ok=True)
+        self.fixtures = FixtureSource(fixtures_dir).fixtures
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def get(self, endpoint: str, query) -> object:
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        async with self.session.get(UPSTREAMS[endpoint], params=query) as response:
+            response.raise_for_status()
+            data = await response.json()
+        self.fixtures.setdefault(endpoint, {})[fixture_key(query)] = data
+        with open(os.path.join(self.fixtures_dir, f'{endpoint}.json'), 'w') as f:
+            json.dump(self.fixtures[endpoint], f)
+        return data
+
+    async def close(self, app: web.Application = None):
+        if self.session is not None:
+            await self.session.close()
+
+
+def create_app(source) -> web.Application:
+    app = web.Application()
+    app['source'] = source
+    app['requests'] = {endpoint: 0 for endpoint in UPSTREAMS}
+
+    async def handler(request: web.Request) -> web.Response:
+        endpoint = ROUTES[request.path]
+        app['requests'][endpoint] += 1
+        data = source.get(endpoint, request.query)
+        if inspect.isawaitable(data):
+            data = await data
+        return web.json_response(data)
+
+    for path in ROUTES:
+        app.router.add_get(path, handler)
+    if isinstance(source, RecordingSource):
+        app.on_cleanup.append(source.close)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for toncenter APIs used by the bot")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--fixtures', help="Directory with recorded responses to replay")
+    parser.add_argument('--record', action='store_true', help="Proxy to real toncenter and save responses to --fixtures")
+    parser.add_argument('--validators', type=int, default=400, help="Synthetic validators count")
+    parser.add_argument('--telemetry-nodes', type=int, default=1000, help="Synthetic telemetry nodes count")
+    parser.add_argument('--overloaded-ratio', type=float, default=0.05, help="Share of synthetic nodes over thresholds")
+    parser.add_argument('--complaints', type=int, default=10, help="Synthetic passed complaints count")
+    args = parser.parse_args()
+
+    if args.record:
+        if not args.fixtures:
+            parser.error("--record requires --fixtures")
+        source = RecordingSource(args.fixtures)
+    elif args.fixtures:
+        source = FixtureSource(args.fixtures)
+    else:
+        source = SyntheticSource(args.validators, args.telemetry_nodes, args.overloaded_ratio, args.complaints)
+
+    web.run_app(create_app(source), host=args.host, port=args.port)
@@ -1,18 +1,19 @@
-import asyncio
-import logging
 import time
 from typing import Optional
 
 from aiogram import Router, types
 from aiogram.filters import Command
+from aiogram.types import BufferedInputFile
 
+from alerts import profiler
 from alerts.alert import ALERTS
+from alerts.broadcast import BroadcastEngine, BroadcastProgress
 from database import Database
+from database.models import BroadcastModel
 
 admin_router = Router()
 
 notification_data: Optional[str] = None
-notification_task: Optional[asyncio.Task] = None
 
 
 async def send_message_to_admins(bot, text: str, admin_users: list[int]) -> None:
@@ -71,6 +72,64 @@ async def get_user_stats(message: types.Message, db_manager: Database, admin_use
         await message.answer(f"<b>Error getting statistics:</b>\n<code>{str(e)}</code>")
 
 
+PROFILE_MODES = {'cpu': (True, False), 'memory': (False, True), 'all': (True, True)}
+PROFILE_USAGE = (
+    "Usage: <code>/profile [runs | &lt;seconds&gt;s] [cpu | memory | all]</code>\n"
+    "<code>/profile 4 all</code> profiles the next 4 alert runs, <code>/profile 60s</code> everything for a minute."
+)
+
+
+@admin_router.message(Command("profile"))
+async def start_profile(message: types.Message, admin_users: list[int]) -> None:
+    if message.from_user.id not in admin_users:
+        await message.answer("You are not authorized to use this command.")
+        return
+    if not profiler.schedulers:
+        await message.answer("The alerts scanner does not run in the bot process (SCANNER_MODE=workers), "
+                             "there is nothing to profile.")
+        return
+    if profiler.session is not None:
+        await message.answer("Profiling is already armed. Use /stop_profile to finish it first.")
+        return
+    runs, seconds, mode = 1, None, 'cpu'
+    try:
+        for arg in message.text.split()[1:]:
+            if arg in PROFILE_MODES:
+                mode = arg
+            elif arg.endswith('s'):
+                seconds = float(arg[:-1])
+            else:
+                runs = int(arg)
+    except ValueError:
+        await message.answer(PROFILE_USAGE)
+        return
+    if runs < 1 or (seconds is not None and not 0 < seconds <= 3600):
+        await message.answer(PROFILE_USAGE)
+        return
+
+    async def on_done(report: profiler.ProfileReport) -> None:
+        await message.answer(report.text)
+        for filename, data in report.files.items():
+            await message.answer_document(BufferedInputFile(data, filename=filename))
+
+    cpu, memory = PROFILE_MODES[mode]
+    profiler.arm(profiler.ProfileSession(on_done, runs=runs, seconds=seconds, cpu=cpu, memory=memory))
+    target = f"for {seconds:g} sec" if seconds is not None else f"for the next {runs} alert runs"
+    await message.answer(f"Profiling ({mode}) armed {target}. Use /stop_profile to finish it early.")
+
+
+@admin_router.message(Command("stop_profile"))
+async def stop_profile(message: types.Message, admin_users: list[int]) -> None:
+    if message.from_user.id not in admin_users:
+        await message.answer("You are not authorized to use this command.")
+        return
+    session = profiler.stop()
+    if session is None:
+        await message.answer("Profiling is not armed.")
+    elif session.started_at is None:
+        await message.answer("Profiling disarmed, no alert run has started yet.")
+
+
 @admin_router.message(Command("add_notification"))
 async def add_notification(message: types.Message, admin_users: list[int]) -> None:
     global notification_data
@@ -98,95 +157,74 @@ async def print_notification(message: types.Message, admin_users: list[int]) ->
 
 
 @admin_router.message(Command("start_notification"))
-async def start_notification(message: types.Message, db_manager: Database, admin_users: list[int]) -> None:
-    global notification_task
-
+async def start_notification(message: types.Message, db_manager: Database, broadcaster: BroadcastEngine, admin_users: list[int]) -> None:
     if message.from_user.id not in admin_users:
         await message.answer("You are not authorized to use this command.")
         return
     if notification_data is None:
         await message.answer("No notification is currently stored. Use /add_notification to add one.")
         return
-    if notification_task is not None and not notification_task.done():
+    if broadcaster.running:
         await message.answer("A notification task is already in progress. Use /stop_notification to cancel it first.")
         return
     status_message = await message.answer("Notification will be sent in 60 seconds. Use /stop_notification to cancel.")
-    notification_task = asyncio.create_task(
-        send_notification_with_delay(message, db_manager, status_message, admin_users)
-    )
+    broadcast = await db_manager.add_broadcast(notification_data, message.from_user.id)
+    start_broadcast(broadcaster, message.bot, broadcast, status_message, admin_users, delay=60)
     report_text = f"Notification sending started by @{message.from_user.username}.\n\nCheck the notification text with /print_notification or cancel it with /stop_notification."
     await send_message_to_admins(message.bot, report_text, admin_users)
 
 
 @admin_router.message(Command("stop_notification"))
-async def stop_notification(message: types.Message, admin_users: list[int]) -> None:
-    global notification_task, notification_data
+async def stop_notification(message: types.Message, broadcaster: BroadcastEngine, admin_users: list[int]) -> None:
+    global notification_data
 
     if message.from_user.id not in admin_users:
         await message.answer("You are not authorized to use this command.")
         return
-    if notification_task is None or notification_task.done():
+    if not broadcaster.running:
         await message.answer("No notification task is currently running.")
         return
-    notification_task.cancel()
-    notification_task = None
+    await broadcaster.cancel()
     notification_data = None
     await send_message_to_admins(message.bot, "Notification task has been cancelled.", admin_users)
 
 
-async def send_notification_with_delay(
-        admin_message: types.Message,
-        db_manager: Database,
-        status_message: types.Message,
-        admin_users: list[int]
-) -> None:
-    global notification_data
-    try:
-        await asyncio.sleep(60)
-
-        await status_message.edit_text("Sending notification to all users...")
-
-        all_users = await db_manager.get_users()
-        total_users = len(all_users)
-        successful = 0
-        blocked = 0
-        failed = 0
-
-        start_time = time.time()
-
-        for user in all_users:
-            try:
-                await admin_message.bot.send_message(
-                    chat_id=user.user_id,
-                    text=notification_data,
-                    parse_mode="HTML"
-                )
-                successful += 1
-
-                await asyncio.sleep(0.05)
-
-            except Exception as e:
-                error_message = str(e).lower()
-                if "bot was blocked" in error_message:
-                    blocked += 1
-                else:
-                    failed += 1
-                logging.info(f"Failed to send notification to user {user.user_id}: {str(e)}")
+def start_broadcast(broadcaster: BroadcastEngine, bot, broadcast: BroadcastModel, status_message: types.Message,
+                    admin_users: list[int], delay: float = 0) -> None:
+    async def on_progress(progress: BroadcastProgress) -> None:
+        await status_message.edit_text(progress.format())
 
+    async def on_done(progress: BroadcastProgress) -> None:
+        global notification_data
         notification_data = None
-
-        execution_time = time.time() - start_time
+        execution_time = time.time() - progress.started_at
         stats_message = (
             "<b>📨 Notification Delivery Report:</b>\n\n"
-            f"👥 Total Users: <code>{total_users}</code>\n"
-            f"✅ Successfully Delivered: <code>{successful}</code>\n"
-            f"🚫 Blocked by User: <code>{blocked}</code>\n"
-            f"❌ Failed to Deliver: <code>{failed}</code>\n\n"
+            f"👥 Total Users: <code>{broadcast.total}</code>\n"
+            f"✅ Successfully Delivered: <code>{broadcast.sent}</code>\n"
+            f"🚫 Blocked by User: <code>{broadcast.blocked}</code>\n"
+            f"❌ Failed to Deliver: <code>{broadcast.failed}</code>\n\n"
             f"⏱ Completed in <code>{execution_time:.2f}</code> sec"
         )
-        await send_message_to_admins(admin_message.bot, stats_message, admin_users)
+        await send_message_to_admins(bot, stats_message, admin_users)
 
-    except asyncio.CancelledError:
-        logging.warning("Notification task cancelled.")
-    except Exception as e:
-        await admin_message.answer(f"<b>Error sending notification:</b>\n<code>{str(e)}</code>")
+    broadcaster.start(broadcast, on_progress, on_done, delay=delay)
+
+
+async def resume_broadcasts(bot, db_manager: Database, broadcaster: BroadcastEngine, admin_users: list[int]) -> None:
+    broadcasts = await db_manager.get_running_broadcasts()
+    if not broadcasts or not admin_users:
+        return
+    # only one broadcast runs at a time, the oldest is resumed and the rest are cancelled
+    broadcast, *extra = broadcasts
+    for cancelled in extra:
+        cancelled.status = 'cancelled'
+        await db_manager.update_broadcast(cancelled)
+    if extra:
+        ids = ", ".join(f"#{b.id}" for b in extra)
+        await send_message_to_admins(bot, f"Notifications {ids} were cancelled after restart.", admin_users)
+    status_message = await bot.send_message(
+        chat_id=admin_users[0],
+        text=f"Resuming notification #{broadcast.id} after restart. Use /stop_notification to cancel."
+    )
+    start_broadcast(broadcaster, bot, broadcast, status_message, admin_users)
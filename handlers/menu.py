@@ -12,6 +12,7 @@ menu_router = Router(name=__name__)
 @menu_router.message(CommandStart())
 async def command_start_handler(message: Message, db_manager: Database, toncenter: Toncenter) -> None:
     await db_manager.add_user_with_alerts(message.from_user.id, message.from_user.username)
+    await db_manager.set_user_blocked(message.from_user.id, False)
     args = message.text.split()
     if len(args) < 2:
         if await db_manager.get_user_nodes(message.from_user.id):
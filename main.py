@@ -9,8 +9,11 @@ from dotenv import load_dotenv
 
 from bot import run_bot
 from alerts_scan import run_alerts_scanner
+from alerts.broadcast import BroadcastEngine
+from alerts.delivery import MessageDelivery
 from alerts.toncenter import Toncenter
 from database import Database
+import metrics
 
 
 async def main():
@@ -20,21 +23,47 @@ async def main():
 
     bot_token = os.getenv('BOT_TOKEN')
     api_key = os.getenv('TONCENTER_API_KEY')
+    toncenter_base_url = os.getenv('TONCENTER_BASE_URL')
+    toncenter_rps = float(os.getenv('TONCENTER_RPS', 10))
     database_url = os.getenv('DATABASE_URL')
+    metrics_port = os.getenv('METRICS_PORT')
+    # 'workers' leaves alerts scanning to scanner_worker.py processes
+    scanner_mode = os.getenv('SCANNER_MODE', 'embedded')
     if not bot_token:
         raise ValueError("BOT_TOKEN environment variable is not set")
 
     db = Database(database_url)
     await db.init_db()
 
-    toncenter = Toncenter(api_key)
+    # the history belongs to the process that scans, workers keep their own
+    history_path = os.getenv('TELEMETRY_HISTORY_PATH') if scanner_mode != 'workers' else None
+    toncenter = Toncenter(api_key, base_url=toncenter_base_url, requests_per_second=toncenter_rps,
+                          history_path=history_path)
+    await toncenter.start()
+
+    metrics_runner = await metrics.start_server(port=int(metrics_port)) if metrics_port else None
 
     bot = Bot(token=bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 
-    asyncio.create_task(
-        run_alerts_scanner(toncenter, db, bot)
-    )
-    await run_bot(bot, db, toncenter)
+    delivery = MessageDelivery(bot, db)
+    await delivery.start()
+    broadcaster = BroadcastEngine(db, delivery)
+
+    alerts_tasks = []
+    if scanner_mode != 'workers':
+        alerts_tasks.append(asyncio.create_task(
+            run_alerts_scanner(toncenter, db, bot, delivery)
+        ))
+    try:
+        await run_bot(bot, db, toncenter, broadcaster)
+    finally:
+        for task in alerts_tasks:
+            task.cancel()
+        await asyncio.gather(*alerts_tasks, return_exceptions=True)
+        await delivery.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await toncenter.close()
     # await asyncio.gather(alerts_task, bot_task)
 
 
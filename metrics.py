@@ -0,0 +1,202 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import time
+from typing import Callable, Optional
+
+from aiohttp import web
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# counters, gauges and histograms in the Prometheus text exposition format, served on /metrics
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REGISTRY: list["Metric"] = []
+
+
+def format_labels(labels: tuple, extra: str = '') -> str:
+    items = [f'{name}="{escape(value)}"' for name, value in labels]
+    if extra:
+        items.append(extra)
+    return '{' + ','.join(items) + '}' if items else ''
+
+
+INF_LABEL = 'le="+Inf"'
+
+
+def quote(value: float) -> str:
+    return '"' + format_value(value) + '"'
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.values: dict[tuple, object] = {}
+        REGISTRY.append(self)
+
+    @staticmethod
+    def key(labels: dict) -> tuple:
+        return tuple(sorted(labels.items()))
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for labels, value in self.collect():
+            lines.append(f'{self.name}{format_labels(labels)} {format_value(value)}')
+        return lines
+
+    def collect(self) -> list[tuple[tuple, float]]:
+        return list(self.values.items())
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self.functions: dict[tuple, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels) -> None:
+        self.values[self.key(labels)] = value
+
+    def set_function(self, function: Callable[[], float], **labels) -> None:
+        # read when scraped, e.g. the length of a queue
+        self.functions[self.key(labels)] = function
+
+    def collect(self) -> list[tuple[tuple, float]]:
+        return list(self.values.items()) + [(labels, function()) for labels, function in self.functions.items()]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self.key(labels)
+        state = self.values.get(key)
+        if state is None:
+            # per bucket counts, sum, count
+            state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            state[0][index] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for labels, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bucket, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{format_labels(labels, f"le={quote(float(bucket))}")} {cumulative}')
+            lines.append(f'{self.name}_bucket{format_labels(labels, INF_LABEL)} {count}')
+            lines.append(f'{self.name}_sum{format_labels(labels)} {format_value(total)}')
+            lines.append(f'{self.name}_count{format_labels(labels)} {count}')
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+
+ALERT_CHECK_SECONDS = Histogram('alert_check_seconds', 'Duration of Alert.check')
+ALERT_ERRORS = Counter('alert_errors_total', 'Alert runs failed with an exception')
+ALERT_TIMEOUTS = Counter('alert_timeouts_total', 'Alert runs cancelled by the scheduler timeout')
+ALERT_LAG_SECONDS = Histogram('alert_lag_seconds', 'Delay of an alert run after its planned start')
+ALERT_RUNS = Counter('alert_runs_total', 'Alert runs started by the scheduler')
+ALERT_SKIPPED = Counter('alert_skipped_total', 'Scheduled alert runs skipped because the previous run was still in progress')
+ALERT_LAST_STARTED = Gauge('alert_last_started_timestamp_seconds', 'Unix time of the last alert run')
+ALERT_LAST_DURATION = Gauge('alert_last_duration_seconds', 'Duration of the last alert run')
+TONCENTER_REQUEST_SECONDS = Histogram('toncenter_request_seconds', 'Duration of a single toncenter HTTP request')
+TONCENTER_RESPONSES = Counter('toncenter_responses_total', 'Toncenter HTTP responses by status, "error" for network errors')
+TONCENTER_RESPONSE_BYTES = Counter('toncenter_response_bytes_total', 'Bytes read from toncenter')
+DB_METHOD_SECONDS = Histogram('db_method_seconds', 'Duration of a Database method')
+DB_QUERIES = Counter('db_queries_total', 'SQL statements executed, by the Database method that issued them')
+DB_QUERY_SECONDS = Histogram('db_query_seconds', 'Duration of a single SQL statement')
+TELEGRAM_SEND_SECONDS = Histogram('telegram_send_seconds', 'Duration of a Telegram sendMessage call')
+TELEGRAM_SENDS = Counter('telegram_sends_total', 'Telegram sendMessage calls by result')
+QUEUE_DEPTH = Gauge('queue_depth', 'Items waiting in an internal queue')
+
+current_method: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('current_method', default=None)
+
+
+def timed_methods(histogram: Histogram) -> Callable[[type], type]:
+    # class decorator observing the duration of every public coroutine method, labeled by the method name
+    def decorate(cls: type) -> type:
+        for name, method in list(vars(cls).items()):
+            if name.startswith('_') or not inspect.iscoroutinefunction(method):
+                continue
+            setattr(cls, name, timed(histogram, name)(method))
+        return cls
+    return decorate
+
+
+def timed(histogram: Histogram, method_name: str) -> Callable:
+    def decorate(method: Callable) -> Callable:
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            token = current_method.set(method_name)
+            started = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, method=method_name)
+                current_method.reset(token)
+        return wrapper
+    return decorate
+
+
+def watch_engine(engine: AsyncEngine) -> None:
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        method = current_method.get() or 'other'
+        DB_QUERIES.inc(method=method)
+        DB_QUERY_SECONDS.observe(time.perf_counter() - started, method=method)
+
+
+async def start_server(host: str = '127.0.0.1', port: int = 9100) -> web.AppRunner:
+    async def handler(request: web.Request) -> web.Response:
+        return web.Response(body=render().encode(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    app = web.Application()
+    app.router.add_get('/metrics', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
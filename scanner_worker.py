@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import os
+import socket
+import sys
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+from dotenv import load_dotenv
+
+from alerts_scan import run_alerts_scanner
+from alerts.cache import SharedResponseCache
+from alerts.delivery import MessageDelivery
+from alerts.shards import ShardLeases
+from alerts.toncenter import Toncenter
+from database import Database
+import metrics
+
+# runs the alerts scanner outside of the bot process, start the bot with SCANNER_MODE=workers
+# and as many workers as needed, they split the users between them through the database
+
+
+async def main():
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+
+    load_dotenv()
+
+    bot_token = os.getenv('BOT_TOKEN')
+    api_key = os.getenv('TONCENTER_API_KEY')
+    toncenter_base_url = os.getenv('TONCENTER_BASE_URL')
+    # the API key quota is shared by the bot and all workers, every process gets a share of it
+    toncenter_rps = float(os.getenv('TONCENTER_RPS', 10))
+    database_url = os.getenv('DATABASE_URL')
+    metrics_port = os.getenv('METRICS_PORT')
+    worker_id = os.getenv('SCANNER_WORKER_ID') or f"{socket.gethostname()}-{os.getpid()}"
+    shards_count = int(os.getenv('SCANNER_SHARDS', 16))
+    delivery_rate = float(os.getenv('SCANNER_DELIVERY_RATE', 10))
+    if not bot_token:
+        raise ValueError("BOT_TOKEN environment variable is not set")
+
+    # subscriptions are changed by the bot process, a worker only sees them after reloading
+    reload_interval = int(os.getenv('SCANNER_RELOAD_INTERVAL', 60))
+
+    db = Database(database_url)
+    await db.init_db()
+
+    # workers sharing a host and .env must not memory-map the same files
+    history_path = os.getenv('TELEMETRY_HISTORY_PATH')
+    if history_path:
+        history_path = os.path.join(history_path, worker_id)
+    toncenter = Toncenter(api_key, base_url=toncenter_base_url, requests_per_second=toncenter_rps,
+                          shared_cache=SharedResponseCache(db), history_path=history_path)
+    await toncenter.start()
+
+    metrics_runner = await metrics.start_server(port=int(metrics_port)) if metrics_port else None
+
+    bot = Bot(token=bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+
+    # the Telegram limit is per bot, every worker gets a share of it
+    delivery = MessageDelivery(bot, db, global_rate=delivery_rate)
+    await delivery.start()
+
+    shards = ShardLeases(db, worker_id[:64], shards_count)
+    await shards.start()
+
+    tasks = [
+        asyncio.create_task(shards.run()),
+        asyncio.create_task(run_alerts_scanner(toncenter, db, bot, delivery, shards, reload_interval)),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await delivery.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await shards.stop()
+        await toncenter.close()
+        await bot.session.close()
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+import numpy as np
+
+from alerts.history import TelemetryHistory
+from alerts.telemetry import NodeTelemetry
+
+
+def report(adnl: str, timestamp: int, cpu: float) -> NodeTelemetry:
+	# CPU percent is cpu_load / cpu_number * 100
+	return NodeTelemetry(adnl_address=adnl, timestamp=timestamp, cpu_load=cpu, cpu_number=100, out_of_sync=5)
+
+
+def record_series(history: TelemetryHistory, adnl: str, values: list[float], start: int = 1000, step: int = 60) -> None:
+	for i, value in enumerate(values):
+		history.record([report(adnl, start + i * step, value)])
+
+
+def duration(history: TelemetryHistory, adnl: str, above: float) -> int:
+	return int(history.duration_over(history.get_rows([adnl]), 'CPU', above=above)[0])
+
+
+def test_duration_of_the_current_run():
+	history = TelemetryHistory(size=8)
+	record_series(history, 'A', [95, 10, 95, 95, 95])
+	assert duration(history, 'A', 90) == 120
+	record_series(history, 'B', [95, 95, 10])
+	assert duration(history, 'B', 90) == -1
+
+
+def test_duration_over_wraparound():
+	history = TelemetryHistory(size=4)
+	# 10 reports in a ring of 4, the head wraps twice and the run started before the oldest kept report
+	record_series(history, 'A', [10, 10, 10, 10, 10, 10, 95, 95, 95, 95])
+	assert int(history.heads[history.rows['A']]) == 10 % 4
+	assert [value for _, value in history.get('A', 'CPU')] == [95, 95, 95, 95]
+	assert duration(history, 'A', 90) == 180
+	# the run is measured from its first kept report, whatever slot of the ring it is in
+	record_series(history, 'A', [10, 95, 95], start=1000 + 10 * 60)
+	assert duration(history, 'A', 90) == 60
+
+
+def test_repeated_reports_are_stored_once():
+	history = TelemetryHistory(size=4)
+	history.record([report('A', 1000, 95)])
+	history.record([report('A', 1000, 95), report('A', 900, 95)])
+	assert history.get('A', 'CPU') == [(1000, 95.0)]
+
+
+def test_filter_sustained_keeps_nodes_without_history():
+	history = TelemetryHistory(size=8)
+	record_series(history, 'A', [95, 95, 95])
+	record_series(history, 'B', [10, 95])
+	rows = history.get_rows(['A', 'B', 'C'])
+	assert history.filter_sustained(rows, [0, 1, 2], 'CPU', 120, above=90) == [0, 2]
+
+
+def test_grow_keeps_existing_rows():
+	history = TelemetryHistory(size=4, capacity=2)
+	for index in range(5):
+		record_series(history, f'N{index}', [index * 10, index * 10 + 1])
+	assert len(history.heads) == 8
+	for index in range(5):
+		assert [value for _, value in history.get(f'N{index}', 'CPU')] == [index * 10, index * 10 + 1]
+
+
+def test_memory_mapped_history_survives_reopening(tmp_path):
+	history = TelemetryHistory(size=4, path=str(tmp_path), capacity=2)
+	for index in range(3):
+		record_series(history, f'N{index}', [95, 96])
+	history.flush()
+	reopened = TelemetryHistory(size=4, path=str(tmp_path))
+	assert reopened.rows == history.rows
+	assert reopened.get('N2', 'CPU') == history.get('N2', 'CPU')
+	assert np.array_equal(reopened.heads, history.heads)
@@ -0,0 +1,122 @@
+import email.utils
+import time
+
+import pytest
+
+from alerts import ratelimit
+from alerts.ratelimit import CircuitBreaker, TokenBucket, parse_retry_after
+from alerts.toncenter import Toncenter
+
+
+class Clock:
+	def __init__(self):
+		self.now = 1000.0
+
+	def __call__(self) -> float:
+		return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+	clock = Clock()
+	monkeypatch.setattr(ratelimit.time, 'monotonic', clock)
+	return clock
+
+
+def test_breaker_opens_after_threshold(clock):
+	breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+	for _ in range(2):
+		breaker.record_failure()
+		assert breaker.state == 'closed' and breaker.allow()
+	breaker.record_failure()
+	assert breaker.state == 'open'
+	assert not breaker.allow()
+
+
+def test_breaker_success_resets_failures(clock):
+	breaker = CircuitBreaker(failure_threshold=3)
+	breaker.record_failure()
+	breaker.record_failure()
+	breaker.record_success()
+	breaker.record_failure()
+	assert breaker.state == 'closed'
+
+
+def test_breaker_half_open_lets_one_probe_through(clock):
+	breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+	breaker.record_failure()
+	clock.now += 29
+	assert not breaker.allow()
+	clock.now += 1
+	assert breaker.state == 'half-open'
+	assert breaker.allow()
+	# the probe is in flight, nothing else gets through
+	assert breaker.state == 'open'
+	assert not breaker.allow()
+
+
+def test_breaker_failed_probe_reopens(clock):
+	breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+	breaker.record_failure()
+	clock.now += 30
+	assert breaker.allow()
+	clock.now += 5
+	breaker.record_failure()
+	clock.now += 29
+	assert breaker.state == 'open'
+	clock.now += 1
+	assert breaker.state == 'half-open'
+
+
+def test_breaker_successful_probe_closes(clock):
+	breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+	breaker.record_failure()
+	clock.now += 30
+	assert breaker.allow()
+	breaker.record_success()
+	assert breaker.state == 'closed' and breaker.failures == 0
+
+
+def test_token_bucket_try_acquire(clock):
+	bucket = TokenBucket(rate=2, capacity=2)
+	assert bucket.try_acquire() == 0
+	assert bucket.try_acquire() == 0
+	assert bucket.try_acquire() == pytest.approx(0.5)
+	clock.now += 0.5
+	assert bucket.try_acquire() == 0
+
+
+def test_token_bucket_pause_and_rate_changes(clock):
+	bucket = TokenBucket(rate=10)
+	bucket.pause(3)
+	assert bucket.try_acquire() == pytest.approx(3)
+	assert not bucket.idle
+	bucket.slow_down()
+	assert bucket.rate == 5
+	for _ in range(20):
+		bucket.slow_down()
+	assert bucket.rate == 1
+	for _ in range(100):
+		bucket.speed_up()
+	assert bucket.rate == 10
+
+
+def test_hosts_share_the_api_key_quota():
+	toncenter = Toncenter('key', requests_per_second=4, rate_limits={'slow.example.com': 1})
+	limiter = toncenter.get_limiter('toncenter.com')
+	assert limiter is toncenter.get_limiter('telemetry.toncenter.com') and limiter.rate == 4
+	slow = toncenter.get_limiter('slow.example.com')
+	assert slow is not limiter and slow.rate == 1
+
+
+def test_parse_retry_after_seconds():
+	assert parse_retry_after('120') == 120
+	assert parse_retry_after('-5') == 0
+	assert parse_retry_after(None) is None
+	assert parse_retry_after('soon') is None
+
+
+def test_parse_retry_after_http_date():
+	value = email.utils.formatdate(time.time() + 60, usegmt=True)
+	assert parse_retry_after(value) == pytest.approx(60, abs=2)
+	assert parse_retry_after(email.utils.formatdate(time.time() - 60, usegmt=True)) == 0
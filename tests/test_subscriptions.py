@@ -0,0 +1,154 @@
+import asyncio
+
+from alerts.scan_context import ScanContext
+from database import Database
+from database.models import UserModel, NodeModel
+from database.subscriptions import SubscriptionIndex
+
+
+def make_index() -> SubscriptionIndex:
+    users = {user_id: UserModel(user_id=user_id) for user_id in (1, 2, 3)}
+    subscriptions = [(users[1], 'TelemetryAlert'), (users[2], 'TelemetryAlert'), (users[3], 'ComplaintsAlert')]
+    nodes = [
+        NodeModel(id=10, user_id=1, adnl='A', label=None),
+        NodeModel(id=11, user_id=2, adnl='A', label='second'),
+        NodeModel(id=12, user_id=2, adnl='B', label=None),
+    ]
+    return SubscriptionIndex(subscriptions, nodes)
+
+
+def subscriber_ids(index: SubscriptionIndex, adnl: str, alert_type: str) -> list[int]:
+    return sorted(user.user_id for user, _ in index.get_subscribers(adnl, alert_type))
+
+
+def test_subscribers_by_adnl():
+    index = make_index()
+    assert subscriber_ids(index, 'A', 'TelemetryAlert') == [1, 2]
+    assert subscriber_ids(index, 'B', 'TelemetryAlert') == [2]
+    assert subscriber_ids(index, 'A', 'ComplaintsAlert') == []
+    assert sorted(u.user_id for u in index.get_users('TelemetryAlert')) == [1, 2]
+    # user 3 has no nodes
+    assert index.get_users('ComplaintsAlert') == []
+    assert [u.user_id for u in index.get_users('ComplaintsAlert', only_with_nodes=False)] == [3]
+
+
+def test_loading_does_not_record_additions():
+    index = make_index()
+    assert index.version == 0
+    assert index.get_added_users(0) == set()
+
+
+def test_added_users_since_version():
+    index = make_index()
+    index.add_node(NodeModel(id=13, user_id=1, adnl='B', label=None))
+    version = index.version
+    index.set_alert_enabled(index.users[3], 'TelemetryAlert', True)
+    assert subscriber_ids(index, 'B', 'TelemetryAlert') == [1, 2]
+    assert index.get_added_users(0) == {1, 3}
+    assert index.get_added_users(version) == {3}
+    assert index.get_added_users(index.version) == set()
+
+
+def test_removals_bump_version_without_additions():
+    index = make_index()
+    index.remove_node(11)
+    assert index.version == 1
+    assert subscriber_ids(index, 'A', 'TelemetryAlert') == [1]
+    assert [n.id for n in index.get_user_nodes(2)] == [12]
+    index.remove_node(12)
+    assert 2 not in index.user_nodes and 'B' not in index.by_adnl
+    index.set_alert_enabled(index.users[1], 'TelemetryAlert', False)
+    assert index.version == 3
+    assert index.get_added_users(0) == set()
+    assert subscriber_ids(index, 'A', 'TelemetryAlert') == []
+
+
+def test_blocked_users_are_skipped_until_unblocked():
+    index = make_index()
+    index.set_user_blocked(1, True)
+    version = index.version
+    assert subscriber_ids(index, 'A', 'TelemetryAlert') == [2]
+    assert not index.is_enabled(1, 'TelemetryAlert')
+    index.set_user_blocked(1, False)
+    assert subscriber_ids(index, 'A', 'TelemetryAlert') == [1, 2]
+    # an unblocked user may have missed alerts, it is checked again as if just subscribed
+    assert index.get_added_users(version) == {1}
+
+
+def test_unchanged_reload_keeps_versions():
+    index = make_index()
+    index.add_node(NodeModel(id=13, user_id=1, adnl='B', label=None))
+    version = index.version
+    loaded = make_index()
+    loaded.add_node(NodeModel(id=13, user_id=1, adnl='B', label=None))
+    index.update(loaded)
+    assert index.version == version
+    assert index.loaded_at == loaded.loaded_at
+
+
+def test_reload_applies_differences_in_place():
+    index = make_index()
+    users = {user_id: UserModel(user_id=user_id) for user_id in (1, 2, 3)}
+    loaded = SubscriptionIndex(
+        [(users[2], 'TelemetryAlert'), (users[3], 'ComplaintsAlert'), (users[3], 'TelemetryAlert')],
+        [NodeModel(id=11, user_id=2, adnl='A', label='renamed'), NodeModel(id=14, user_id=3, adnl='B', label=None)],
+        {2},
+    )
+    index.update(loaded)
+    assert sorted(index.nodes) == [11, 14]
+    assert index.nodes[11].label == 'renamed'
+    assert subscriber_ids(index, 'B', 'TelemetryAlert') == [3]
+    assert subscriber_ids(index, 'A', 'TelemetryAlert') == []
+    assert index.blocked == {2}
+    assert index.get_added_users(0) == {3}
+
+
+def test_changes_during_reload_are_replayed(tmp_path):
+    async def scenario():
+        db = Database(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+        await db.init_db()
+        await db.add_user_with_alerts(1)
+        await db.add_node(1, 'A')
+        index = await db.get_subscriptions()
+        version = index.version
+        load, loading = db.get_alert_subscriptions, asyncio.Event()
+        resume = asyncio.Event()
+
+        async def slow_load():
+            result = await load()
+            loading.set()
+            await resume.wait()
+            return result
+
+        db.get_alert_subscriptions = slow_load
+        reload = asyncio.create_task(db.get_subscriptions(max_age=-1))
+        await loading.wait()
+        # committed after the reload read the tables
+        await db.add_node(1, 'B')
+        resume.set()
+        assert await reload is index
+        await db.close()
+        return index, version
+
+    index, version = asyncio.run(scenario())
+    assert sorted(index.by_adnl) == ['A', 'B']
+    assert index.version == version + 1
+
+
+def test_reload_keeps_the_index_and_triggered_alerts(tmp_path):
+    async def scenario():
+        db = Database(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+        await db.init_db()
+        await db.add_user_with_alerts(1)
+        await db.add_node(1, 'A')
+        context = await ScanContext.load(db)
+        version = context.subscriptions.version
+        reloaded = await ScanContext.load(db, max_age=-1)
+        await db.close()
+        return context, version, reloaded
+
+    context, version, reloaded = asyncio.run(scenario())
+    # an unchanged reload is no change for the alerts that skip unchanged checks
+    assert reloaded.subscriptions is context.subscriptions
+    assert reloaded.subscriptions.version == version
+    assert reloaded.triggered is context.triggered and reloaded.triggered.generation == 0
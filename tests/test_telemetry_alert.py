@@ -0,0 +1,129 @@
+import asyncio
+
+from alerts.history import TelemetryHistory
+from alerts.scan_context import ScanContext
+from alerts.telemetry import NodeTelemetry, TelemetrySnapshot
+from alerts.telemetry_alert import TelemetryAlert
+from database.models import UserModel, NodeModel
+from database.subscriptions import SubscriptionIndex
+from database.triggered import TriggeredAlerts
+
+
+class FakeToncenter:
+	def __init__(self):
+		self.telemetry_history = TelemetryHistory(size=16)
+		self.reports: dict[str, NodeTelemetry] = {}
+
+	def report(self, adnl: str, timestamp: int, sync: int = 5, cpu: float = 10) -> None:
+		# CPU percent is cpu_load / cpu_number * 100
+		self.reports[adnl] = NodeTelemetry(adnl_address=adnl, timestamp=timestamp, out_of_sync=sync, cpu_load=cpu, cpu_number=100)
+
+	async def get_telemetry_snapshot(self) -> TelemetrySnapshot:
+		entries = list(self.reports.values())
+		self.telemetry_history.record(entries)
+		return TelemetrySnapshot(entries)
+
+
+def make_alert(toncenter: FakeToncenter) -> TelemetryAlert:
+	users = {user_id: UserModel(user_id=user_id) for user_id in (1, 2)}
+	subscriptions = SubscriptionIndex(
+		[(users[1], 'TelemetryAlert'), (users[2], 'TelemetryAlert')],
+		[NodeModel(id=10, user_id=1, adnl='A', label=None), NodeModel(id=11, user_id=1, adnl='B', label=None)],
+	)
+	context = ScanContext(subscriptions, TriggeredAlerts(set()))
+	alert = TelemetryAlert(toncenter, None, None, context=context)
+	# every warning is recorded, those of the nodes in `failing` raise
+	alert.warned, alert.failing = [], set()
+	warn = alert.warn
+
+	async def recording_warn(user, alert_type, overloaded, node, node_data, threshold):
+		alert.warned.append((user.user_id, alert_type, node.adnl))
+		if node.adnl in alert.failing:
+			raise ConnectionError("database is down")
+		await warn(user, alert_type, overloaded, node, node_data, threshold)
+
+	alert.warn = recording_warn
+	return alert
+
+
+def check(alert: TelemetryAlert) -> list[int]:
+	# chat ids of the messages the check sent
+	alert.warned = []
+	asyncio.run(alert.check(alert.context.get_users(alert.alert_type)))
+	return [message.chat_id for message in alert.context.outbox.render()]
+
+
+def test_unchanged_nodes_are_skipped():
+	toncenter = FakeToncenter()
+	toncenter.report('A', 1000, sync=50)
+	toncenter.report('B', 1000)
+	alert = make_alert(toncenter)
+	assert alert.get_changed(list(toncenter.reports.values())) is None
+	assert check(alert) == [1]
+	assert alert.warned == [(1, 'Sync', 'A')]
+	assert alert.evaluated_reports == {'A': 1000, 'B': 1000}
+
+	assert check(alert) == []
+	assert alert.warned == []
+	toncenter.report('A', 1060)
+	assert alert.get_changed(list(toncenter.reports.values())) == [True, False]
+	assert check(alert) == [1]
+	assert alert.warned == [(1, 'Sync', 'A')]
+	assert (1, 'TelemetryAlert-Sync-A') not in alert.context.triggered
+
+
+def test_failed_warning_is_checked_again():
+	toncenter = FakeToncenter()
+	toncenter.report('A', 1000, sync=50)
+	toncenter.report('B', 1000, sync=50)
+	alert = make_alert(toncenter)
+	alert.failing = {'A'}
+	assert check(alert) == [1]
+	assert alert.evaluated_reports == {'B': 1000}
+	alert.failing = set()
+	# no new report, the node is checked again because its warning failed
+	assert check(alert) == [1]
+	assert alert.warned == [(1, 'Sync', 'A')]
+
+
+def test_full_check_after_reload():
+	toncenter = FakeToncenter()
+	toncenter.report('A', 1000, sync=50)
+	alert = make_alert(toncenter)
+	check(alert)
+	nodes = list(toncenter.reports.values())
+	assert alert.get_changed(nodes) == [False]
+	# a reload found rows that memory did not have, every node is checked against them
+	alert.context.triggered.remove(1, 'TelemetryAlert-Sync-A')
+	alert.context.triggered.generation += 1
+	assert alert.get_changed(nodes) is None
+	assert check(alert) == [1]
+	alert.context = ScanContext(alert.context.subscriptions, TriggeredAlerts(set()))
+	assert alert.get_changed(nodes) is None
+
+
+def test_new_subscriber_is_checked():
+	toncenter = FakeToncenter()
+	toncenter.report('A', 1000, sync=50)
+	toncenter.report('B', 1000, sync=50)
+	alert = make_alert(toncenter)
+	# both nodes in one digest
+	assert check(alert) == [1]
+	alert.context.subscriptions.add_node(NodeModel(id=12, user_id=2, adnl='A', label=None))
+	assert alert.get_changed(list(toncenter.reports.values())) == [True, False]
+	# the existing subscriber is not alerted twice
+	assert check(alert) == [2]
+	assert sorted(alert.warned) == [(1, 'Sync', 'A'), (2, 'Sync', 'A')]
+
+
+def test_sustain_and_hysteresis():
+	toncenter = FakeToncenter()
+	alert = make_alert(toncenter)
+	assert TelemetryAlert.THRESHOLDS['CPU'] == (90, 85) and TelemetryAlert.SUSTAIN['CPU'] == 120
+	sent = []
+	for timestamp, cpu in [(1000, 95), (1060, 95), (1120, 95), (1180, 88), (1240, 95), (1300, 80), (1360, 80), (1420, 80)]:
+		toncenter.report('A', timestamp, cpu=cpu)
+		sent.append((timestamp, check(alert)))
+	# raised after 120 seconds over 90, not cleared between the thresholds, cleared after 120 seconds under 85
+	assert sent == [(1000, []), (1060, []), (1120, [1]), (1180, []), (1240, []), (1300, []), (1360, []), (1420, [1])]
+	assert (1, 'TelemetryAlert-CPU-A') not in alert.context.triggered
@@ -0,0 +1,152 @@
+import asyncio
+
+from database.triggered import TriggeredAlerts
+
+
+def test_add_and_remove_cancel_out():
+    triggered = TriggeredAlerts({(1, 'x')})
+    triggered.add(2, 'x')
+    triggered.remove(2, 'x')
+    assert not triggered.pending
+    triggered.remove(1, 'x')
+    triggered.add(1, 'x')
+    assert not triggered.pending
+    assert (1, 'x') in triggered and (2, 'x') not in triggered
+
+
+def test_repeated_changes_are_ignored():
+    triggered = TriggeredAlerts({(1, 'x')})
+    triggered.add(1, 'x')
+    triggered.remove(2, 'x')
+    assert not triggered.pending
+    triggered.add(2, 'x')
+    triggered.add(2, 'x')
+    assert list(triggered.added) == [(2, 'x')]
+
+
+def test_counts_per_alert_name():
+    triggered = TriggeredAlerts({(1, 'x'), (2, 'x'), (1, 'y')})
+    assert triggered.count('x') == 2 and triggered.count('y') == 1 and triggered.count('z') == 0
+    triggered.remove(1, 'y')
+    triggered.add(3, 'x')
+    assert triggered.count('x') == 3 and triggered.count('y') == 0
+    assert 'y' not in triggered.counts
+
+
+class FailingDatabase:
+    def __init__(self, failures: int = 1):
+        self.failures = failures
+        self.applied: list[tuple[list, list]] = []
+
+    async def apply_triggered_alerts(self, added: list, deleted: list) -> None:
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database is down")
+        self.applied.append((sorted(added), sorted(deleted)))
+
+
+def flush(triggered: TriggeredAlerts, database: FailingDatabase) -> bool:
+    try:
+        asyncio.run(triggered.flush(database))
+    except ConnectionError:
+        return False
+    return True
+
+
+def test_failed_flush_is_requeued():
+    triggered = TriggeredAlerts({(1, 'x')})
+    triggered.add(2, 'x')
+    triggered.remove(1, 'x')
+    timestamp = triggered.added[(2, 'x')]
+    database = FailingDatabase()
+    assert not flush(triggered, database)
+    assert triggered.added == {(2, 'x'): timestamp} and triggered.deleted == {(1, 'x')}
+    assert flush(triggered, database)
+    assert database.applied == [([(2, 'x', timestamp)], [(1, 'x')])]
+    assert not triggered.pending
+
+
+def test_requeue_keeps_changes_made_during_the_failed_flush():
+    triggered = TriggeredAlerts({(1, 'x')})
+    triggered.add(2, 'x')
+    triggered.remove(1, 'x')
+    database = FailingDatabase()
+
+    async def apply_and_change(added, deleted):
+        # the alerts run on while the batch is being written
+        triggered.remove(2, 'x')
+        triggered.add(1, 'x')
+        triggered.add(3, 'x')
+        raise ConnectionError("database is down")
+
+    database.apply_triggered_alerts = apply_and_change
+    assert not flush(triggered, database)
+    # (2, 'x') was never written and is gone again, (1, 'x') was never deleted and is back
+    assert set(triggered.added) == {(3, 'x')}
+    assert triggered.deleted == set()
+    assert triggered.names == {(1, 'x'), (3, 'x')}
+
+
+def test_requeue_after_flush_and_change_of_the_same_key():
+    triggered = TriggeredAlerts(set())
+    triggered.add(1, 'x')
+    database = FailingDatabase()
+
+    async def apply_and_change(added, deleted):
+        triggered.remove(1, 'x')
+        triggered.add(1, 'x')
+        raise ConnectionError("database is down")
+
+    database.apply_triggered_alerts = apply_and_change
+    assert not flush(triggered, database)
+    assert set(triggered.added) == {(1, 'x')} and triggered.deleted == set()
+
+
+class SlowDatabase:
+    # a triggered_alerts table whose writes wait until released
+    def __init__(self, rows: set[tuple[int, str]]):
+        self.rows = set(rows)
+        self.writing = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def apply_triggered_alerts(self, added: list, deleted: list) -> None:
+        self.writing.set()
+        await self.release.wait()
+        self.rows -= set(deleted)
+        self.rows |= {(user_id, alert_name) for user_id, alert_name, _ in added}
+
+    async def get_all_triggered_alerts(self) -> set[tuple[int, str]]:
+        return set(self.rows)
+
+
+def test_reload_during_a_slow_flush():
+    async def scenario():
+        triggered = TriggeredAlerts({(1, 'x')})
+        database = SlowDatabase({(1, 'x')})
+        triggered.add(2, 'x')
+        flushing = asyncio.create_task(triggered.flush(database))
+        await database.writing.wait()
+        triggered.add(3, 'x')
+        triggered.remove(1, 'x')
+        reloading = asyncio.create_task(triggered.reload(database))
+        await asyncio.sleep(0)
+        database.release.set()
+        await asyncio.gather(flushing, reloading)
+        return triggered, database
+
+    triggered, database = asyncio.run(scenario())
+    assert database.rows == {(1, 'x'), (2, 'x')}
+    assert triggered.names == {(2, 'x'), (3, 'x')}
+    assert set(triggered.added) == {(3, 'x')} and triggered.deleted == {(1, 'x')}
+    assert triggered.count('x') == 2
+    assert triggered.generation == 0
+
+
+def test_reload_picks_up_rows_changed_elsewhere():
+    triggered = TriggeredAlerts({(1, 'x')})
+    triggered.expired = True
+    triggered.add(2, 'y')
+    asyncio.run(triggered.reload(SlowDatabase({(1, 'x'), (3, 'x')})))
+    assert triggered.names == {(1, 'x'), (2, 'y'), (3, 'x')}
+    assert triggered.count('x') == 2 and triggered.pending
+    assert triggered.generation == 1 and not triggered.expired
@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+import pytest
+
+from alerts.utils import iter_json_array
+
+
+async def chunked(data: bytes, size: int):
+	for i in range(0, len(data), size):
+		yield data[i:i + size]
+
+
+def decode(data: bytes, size: int) -> list:
+	async def collect():
+		return [item async for item in iter_json_array(chunked(data, size))]
+	return asyncio.run(collect())
+
+
+ITEMS = [
+	{'adnl_address': 'AB' * 32, 'timestamp': 1700000000, 'data': {'cpuLoad': [1.5, 2.25, 3.0]}},
+	{'text': 'quote " backslash \\ brackets ] [ comma , braces } {', 'unicode': 'тон 🚀'},
+	12345678901234567890,
+	-0.5e-3,
+	'a string ending with an escaped quote \\"',
+	[],
+	{},
+	None,
+	True,
+]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, 10 ** 6])
+def test_any_chunk_boundary(size):
+	data = json.dumps(ITEMS, ensure_ascii=False).encode()
+	assert decode(data, size) == ITEMS
+
+
+def test_number_split_across_chunks():
+	assert decode(b'[123,456]', 2) == [123, 456]
+	assert decode(b'[1.25e10]', 4) == [1.25e10]
+	# a valid number prefix must not be yielded before the rest of it arrives
+	assert decode(b'[-0.5, 1e-3, 10]', 1) == [-0.5, 1e-3, 10]
+
+
+def test_whitespace_and_empty_array():
+	assert decode(b' \n[ ]\n', 1) == []
+	assert decode(b'[ 1 ,\n 2 ]', 1) == [1, 2]
+
+
+def test_multibyte_character_split_across_chunks():
+	data = json.dumps(['🚀🚀'], ensure_ascii=False).encode()
+	assert decode(data, 1) == ['🚀🚀']
+
+
+@pytest.mark.parametrize('data', [b'[1, 2', b'[{"a": 1}, {"b":', b'["unterminated', b'[1,'])
+def test_truncated_input(data):
+	with pytest.raises(ValueError):
+		decode(data, 3)
+
+
+def test_not_an_array():
+	with pytest.raises(ValueError):
+		decode(b'{"a": 1}', 4)